@@ -10,13 +10,15 @@
     'license': 'LGPL-3',
     'category': '',
     'depends': [
-        'account_accountant'
+        'account_accountant',
+        'payment_mollie_official',
     ],
     'data': [
         'views/account_journal.xml',
         'views/bank_statement.xml',
         'views/templates.xml',
         'wizard/mollie_init_views.xml',
+        'data/cron.xml',
         'security/ir.model.access.csv'
     ],
     "qweb": ['static/src/xml/*.xml'],
@@ -3,16 +3,79 @@
 import json
 import logging
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import split_every
+
+from odoo.addons.payment_mollie_official.tools import RequestExecutor, api_metrics
 
 
 _logger = logging.getLogger(__name__)
 
 TIMEOUT = 20
 API_DEBUG = False
+RATE_LIMIT = 10     # max API calls started per second for one API key
+PREFETCH_NEXT_PAGE = True
+STATEMENT_LINE_BATCH_SIZE = 500
+
+API_ENDPOINT = "https://api.mollie.com"     # can be changed with `mollie_account_sync.api_endpoint` system parameter (local stand-in for benchmarks)
+
+SETTLEMENT_ENDPOINTS = {
+    'payments': "/v2/settlements/%s/payments?limit=250",
+    'refunds': "/v2/settlements/%s/refunds?embed=payment&limit=250",
+    'captures': "/v2/settlements/%s/captures?embed=payment",
+    'chargebacks': "/v2/settlements/%s/chargebacks?embed=payment&limit=250",
+}
+
+_request_executors = {}
+_request_executors_lock = threading.Lock()
+
+
+def _mollie_http_get(api_endpoint, headers, requester):
+    """ Plain GET on mollie API with `requester` (`RequestExecutor` of the API key).
+        This does not use the ORM so it can be used from worker threads, errors
+        are raised as requests exceptions once the retries are exhausted.
+    """
+    _logger.info('Mollie SYNC CALL on: %s', api_endpoint)
+    req = requester.request('GET', api_endpoint, timeout=TIMEOUT, headers=headers)
+    return req.json()
+
+
+def _mollie_iter_items(api_endpoint, resource, headers, requester, prefetch=False, executor=None, first_page=None):
+    """ Generator that yields embedded `resource` items page by page following `_links.next`.
+
+        With `prefetch` (or `executor`) the next page is requested in background thread
+        while the items of current page are consumed, so at most two pages are kept in
+        memory. `first_page` is the future of the first page when it is already requested.
+        Like `_mollie_http_get` this does not use the ORM.
+    """
+    own_executor = ThreadPoolExecutor(max_workers=1) if prefetch and not executor else None
+    executor = executor or own_executor
+    try:
+        data = first_page.result() if first_page else _mollie_http_get(api_endpoint, headers, requester)
+        while data:
+            next_endpoint = data["_links"]['next'] and data["_links"]['next']['href']
+            next_page = None
+            if next_endpoint and executor:
+                next_page = executor.submit(_mollie_http_get, next_endpoint, headers, requester)
+            if data['count'] > 0:
+                yield from data['_embedded'][resource]
+            if not next_endpoint:
+                break
+            data = next_page.result() if next_page else _mollie_http_get(next_endpoint, headers, requester)
+    finally:
+        if own_executor:
+            own_executor.shutdown(wait=False)
+
+
+def _mollie_stream_items(api_endpoint, resource, headers, requester, executor):
+    """ Same as `_mollie_iter_items` on `executor` but the first page is requested right away """
+    first_page = executor.submit(_mollie_http_get, api_endpoint, headers, requester)
+    return _mollie_iter_items(api_endpoint, resource, headers, requester, executor=executor, first_page=first_page)
 
 
 class AccountJournal(models.Model):
@@ -22,6 +85,11 @@ class AccountJournal(models.Model):
     mollie_api_key = fields.Char(string="Mollie Organisation Access token")
     mollie_test = fields.Boolean()
     mollie_last_sync = fields.Datetime()
+    mollie_last_settlement_id = fields.Char(string="Last Mollie Settlement", readonly=True, copy=False,
+                                            help="Cursor of the automatic sync. Settlements older than this one are not fetched again.")
+    mollie_auto_sync = fields.Boolean(string="Automatic Mollie Sync", help="Import new paid out settlements with scheduled action.")
+    mollie_sync_workers = fields.Integer(string="Parallel Mollie Requests", default=4,
+                                         help="Number of parallel API requests used to fetch settlement data. Use 1 to fetch sequentially.")
 
     def __get_bank_statements_available_sources(self):
         """ Adding new source for statement """
@@ -41,8 +109,8 @@ class AccountJournal(models.Model):
 
         # Just For testing account (This is not based on test account)
         if self.mollie_test and API_DEBUG:
-            payment_data = self._mollie_api_call('https://api.mollie.com/v2/payments?limit=3')['_embedded']['payments']
-            refund_data = self._mollie_api_call('https://api.mollie.com/v2/refunds?limit=1')['_embedded']['refunds']
+            payment_data = self._mollie_api_call(self._mollie_api_url('/v2/payments?limit=3'))['_embedded']['payments']
+            refund_data = self._mollie_api_call(self._mollie_api_url('/v2/refunds?limit=1'))['_embedded']['refunds']
             settlement = {
                 'reference': "TEST 123123",
                 'createdAt': "2020-02-29T04:30:00+00:00"
@@ -92,19 +160,123 @@ class AccountJournal(models.Model):
         if settlements_data['count'] == 0:
             return
         settlements_data['_embedded']['settlements'].reverse()
-        BankStatement = self.env['account.bank.statement']
+        known_settlement_ids = self._mollie_get_known_settlement_ids([settlement['id'] for settlement in settlements_data['_embedded']['settlements']])
+        settlements_to_sync = []
         for settlement in settlements_data['_embedded']['settlements']:
             # TODO: Manage chargeback
-            exist = BankStatement.search([('mollie_settlement_id', '=', settlement['id'])], limit=1)
-            if exist:
+            if settlement['id'] in known_settlement_ids:
                 continue
             if settlement['status'] != 'paidout':
                 continue
-            payment_data = self._api_get_settlement_payments(settlement['id'])
-            refund_data = self._api_get_settlement_refunds(settlement['id'])
-            capture_data = self._api_get_settlement_captures(settlement['id'])
-            chargeback_data = self._api_get_settlement_chargebacks(settlement['id'])
-            self._create_bank_statements(payment_data, refund_data, capture_data, chargeback_data, settlement)
+            settlements_to_sync.append(settlement)
+
+        if settlements_to_sync:
+            self._mollie_import_settlements(settlements_to_sync)
+
+    def _mollie_get_known_settlement_ids(self, settlement_ids):
+        """ Returns set of settlement ids which already have bank statement """
+        statements = self.env['account.bank.statement'].search_read([('mollie_settlement_id', 'in', settlement_ids)], ['mollie_settlement_id'])
+        return {statement['mollie_settlement_id'] for statement in statements}
+
+    @api.model
+    def _cron_mollie_sync_settlements(self):
+        """ Import new settlements for all the journals with automatic sync enabled.
+            Each journal is committed separately so an error in one journal
+            does not block the others.
+        """
+        journals = self.search([('bank_statements_source', '=', 'mollie_sync'), ('mollie_auto_sync', '=', True), ('mollie_api_key', '!=', False)])
+        for journal in journals:
+            try:
+                journal._mollie_sync_settlements_incremental()
+                self.env.cr.commit()
+            except UserError as e:
+                self.env.cr.rollback()
+                _logger.error('Mollie SYNC issue for journal %s: %s', journal.name, e)
+            except Exception:
+                self.env.cr.rollback()
+                _logger.exception('Mollie SYNC failed for journal %s', journal.name)
+        return True
+
+    def _mollie_sync_settlements_incremental(self):
+        """ Import only the settlements created after the stored cursor.
+
+            Settlements are listed newest first by mollie so we only page until
+            the cursor is found. Cursor is moved to the newest settlement which
+            can not change anymore, open and pending settlements are checked again
+            in next sync.
+        """
+        self.ensure_one()
+        cursor = self._mollie_get_settlement_cursor()
+        if not cursor:
+            _logger.info('Mollie SYNC: journal %s has no synced settlement yet, use the sync wizard for the first import', self.name)
+            return
+
+        new_settlements = []
+        for settlement in self._mollie_api_iter(self._mollie_api_url("/v2/settlements?limit=250"), 'settlements'):
+            if settlement['id'] == cursor:
+                break
+            new_settlements.append(settlement)
+        new_settlements.reverse()   # oldest first
+
+        settlements_to_sync = []
+        for settlement in new_settlements:
+            if settlement['status'] in ['open', 'pending']:
+                break
+            if settlement['status'] == 'paidout':
+                settlements_to_sync.append(settlement)
+            cursor = settlement['id']
+
+        if settlements_to_sync:
+            settlements_to_sync.reverse()   # `_process_settlements` expects api order
+            self._process_settlements({'count': len(settlements_to_sync), '_embedded': {'settlements': settlements_to_sync}})
+        self.write({
+            'mollie_last_settlement_id': cursor,
+            'mollie_last_sync': fields.Datetime.now(),
+        })
+
+    def _mollie_get_settlement_cursor(self):
+        """ Last synced settlement id, fallback on latest imported statement of the journal """
+        if self.mollie_last_settlement_id:
+            return self.mollie_last_settlement_id
+        last_statement = self.env['account.bank.statement'].search([('journal_id', '=', self.id), ('mollie_settlement_id', '!=', False)], order='date desc, id desc', limit=1)
+        return last_statement.mollie_settlement_id
+
+    def _mollie_import_settlements(self, settlements):
+        """ Import the settlements one by one in the settlement order with the
+            current cursor, threads of the bounded pool only do HTTP calls. With
+            one worker the requests are still sent one at a time.
+
+            Payments, refunds, captures and chargebacks of the settlement are
+            streamed in parallel, each of them keeps at most two pages in memory.
+            Only the first pages of the next settlement are requested while
+            current one is imported, later settlements are not fetched yet.
+
+            :param settlements: list of settlements data to import
+        """
+        headers = self._mollie_api_headers()
+        requester = self._mollie_request_executor()
+
+        with ThreadPoolExecutor(max_workers=max(self.mollie_sync_workers, 1)) as executor:
+            try:
+                next_items = self._mollie_stream_settlement_items(settlements[0], headers, requester, executor)
+                for index, settlement in enumerate(settlements):
+                    settlement_items = next_items
+                    if index + 1 < len(settlements):
+                        next_items = self._mollie_stream_settlement_items(settlements[index + 1], headers, requester, executor)
+                    self._create_bank_statements(*settlement_items, settlement)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+                _logger.error('Mollie SYNC issue: %s', e)
+                raise UserError(_('Some thing went wrong please try again after some time.'))
+
+    def _mollie_stream_settlement_items(self, settlement, headers, requester, executor):
+        """ Returns generators of payments, refunds, captures and chargebacks of the
+            settlement, their first page is requested right away on `executor`.
+        """
+        base_url = self._mollie_api_url('')
+        return [
+            _mollie_stream_items(base_url + SETTLEMENT_ENDPOINTS[resource] % settlement['id'], resource, headers, requester, executor)
+            for resource in ['payments', 'refunds', 'captures', 'chargebacks']
+        ]
 
     def _create_bank_statements(self, payment_data, refund_data, capture_data, chargeback_data, settlement_data, return_lines=False):
         """ Create new bank statement based on settlement, settlement payments and settlement refunds.
@@ -117,6 +289,7 @@ class AccountJournal(models.Model):
         """
         BankStatement = self.env['account.bank.statement']
         statement_lines = []
+        partner_lines = []  # (statement line values, mollie payment id) partners are resolved in batch
 
         for payment in payment_data:
             if not payment.get('settlementAmount'):
@@ -127,8 +300,9 @@ class AccountJournal(models.Model):
                 'amount': float(payment['settlementAmount']['value']),
                 'mollie_transaction_id': payment['id'],
             }
-            statement_line.update(self._parse_payment_metadata(payment, 'Payment'))
-            statement_lines.append((0, 0, statement_line))
+            statement_line.update(self._parse_payment_metadata(payment, 'Payment', resolve_partner=False))
+            partner_lines.append((statement_line, payment['id']))
+            statement_lines.append(statement_line)
 
         for refund in refund_data:
             if not refund.get('settlementAmount'):
@@ -140,10 +314,11 @@ class AccountJournal(models.Model):
                 'mollie_transaction_id': refund['id'],
             }
             if refund.get('_embedded') and refund['_embedded'].get('payment'):
-                statement_line.update(self._parse_payment_metadata(refund['_embedded']['payment'], 'Refund'))
-            statement_lines.append((0, 0, statement_line))
+                statement_line.update(self._parse_payment_metadata(refund['_embedded']['payment'], 'Refund', resolve_partner=False))
+                partner_lines.append((statement_line, refund['_embedded']['payment']['id']))
+            statement_lines.append(statement_line)
         for fee_line in self.get_payment_fees_lines(settlement_data)['lines']:
-            statement_lines.append((0, 0, fee_line))
+            statement_lines.append(fee_line)
 
         for capture in capture_data:
             if not capture.get('settlementAmount'):
@@ -155,8 +330,9 @@ class AccountJournal(models.Model):
                 'mollie_transaction_id': capture['id'],
             }
             if capture.get('_embedded') and capture['_embedded'].get('payment'):
-                statement_line.update(self._parse_payment_metadata(capture['_embedded']['payment'], 'Capture'))
-            statement_lines.append((0, 0, statement_line))
+                statement_line.update(self._parse_payment_metadata(capture['_embedded']['payment'], 'Capture', resolve_partner=False))
+                partner_lines.append((statement_line, capture['_embedded']['payment']['id']))
+            statement_lines.append(statement_line)
 
         for chargeback in chargeback_data:
             if not chargeback.get('settlementAmount'):
@@ -168,124 +344,96 @@ class AccountJournal(models.Model):
                 'mollie_transaction_id': chargeback['id'],
             }
             if chargeback.get('_embedded') and chargeback['_embedded'].get('payment'):
-                statement_line.update(self._parse_payment_metadata(chargeback['_embedded']['payment'], 'Chargeback'))
-            statement_lines.append((0, 0, statement_line))
+                statement_line.update(self._parse_payment_metadata(chargeback['_embedded']['payment'], 'Chargeback', resolve_partner=False))
+                partner_lines.append((statement_line, chargeback['_embedded']['payment']['id']))
+            statement_lines.append(statement_line)
+
+        self._mollie_set_lines_partner(partner_lines)
 
         # Add full statement amount as minus so statement difference is 0
         # and end user will need to internal transfer same account
-        statement_lines.append((0, 0, {
+        statement_lines.append({
             'date': self._format_mollie_date(settlement_data['createdAt']),
             'payment_ref': 'MOLLIE PAYMENTS REF %s (for Internal Transfer)' % (settlement_data['reference']),
             'amount': - float(settlement_data['amount']['value']),
-        }))
+        })
 
         statement_vals = {
             'name': settlement_data['reference'],
             'date': self._format_mollie_date(settlement_data['createdAt']),
             'journal_id': self.id,
-            'line_ids': statement_lines,
             'mollie_settlement_id': settlement_data['id'],
         }
 
         statement = BankStatement.create(statement_vals)
+        self._mollie_create_statement_lines(statement, statement_lines)
         statement.balance_end_real = statement.balance_end
 
         # This FIXes Rounding issues
         diff = statement.balance_start - statement.balance_end_real
         if diff >= -0.05 and diff <= 0.05 and diff != 0:
-            line_data = [(4, l.id, 0) for l in statement.line_ids]
             last_line = statement.line_ids[-1]
-            line_data.append((0, 0, {
+            self.env['account.bank.statement.line'].create({
+                'statement_id': statement.id,
                 'date': last_line.date,
                 'payment_ref': 'Mollie rounding difference',
                 'ref': 'Mollie rounding difference',
                 'amount': diff
-            }))
-            statement.line_ids = line_data
+            })
             statement.balance_end_real = statement.balance_end
 
+    def _mollie_create_statement_lines(self, statement, lines_vals):
+        """ Create statement lines in chunks of `STATEMENT_LINE_BATCH_SIZE`.
+
+            Balance fields of the statement are protected while lines are inserted
+            so they are not recomputed after each chunk, they are computed once
+            when all the lines are created.
+
+            :param statement: bank statement record
+            :param lines_vals: list of values for statement lines
+        """
+        StatementLine = self.env['account.bank.statement.line']
+        balance_fields = [statement._fields[name] for name in ['balance_end', 'total_entry_encoding', 'difference'] if name in statement._fields]
+        with self.env.protecting(balance_fields, statement):
+            for lines_chunk in split_every(STATEMENT_LINE_BATCH_SIZE, lines_vals, list):
+                StatementLine.create([dict(line_vals, statement_id=statement.id) for line_vals in lines_chunk])
+        statement.modified(['line_ids'])
+
     # =================
     # API CALLS METHODS
     # =================
 
     def _api_get_settlements(self, limit=None):
         """ Fetch settlements data from mollie api"""
-        api_endpoint = "https://api.mollie.com/v2/settlements"
+        api_endpoint = self._mollie_api_url("/v2/settlements")
         if limit:
             api_endpoint += '?limit=' + str(limit)
         return self._mollie_api_call(api_endpoint)
 
-    # TODO: settlement payments, refund, capture, and chargeback can merged in one method
-    # Fetch data for settlement payment
+    # Settlement payments, refunds, captures and chargebacks are returned as generators.
+    # Items are streamed page by page so whole lists are never kept in the memory.
     def _api_get_settlement_payments(self, settlement_id):
-        """ Fetch settlements data from mollie api"""
-        api_endpoint = "https://api.mollie.com/v2/settlements/%s/payments?limit=250" % settlement_id
-        payment_data = self._api_call_payments_recursive(api_endpoint)
-        return payment_data
-
-    def _api_call_payments_recursive(self, api_endpoint):
-        payments = []
-        payment_data = self._mollie_api_call(api_endpoint)
-        if payment_data and payment_data['count'] > 0:
-            payments.extend(payment_data['_embedded']['payments'])
-        if payment_data["_links"]['next']:
-            next_payments = self._api_call_payments_recursive(payment_data["_links"]['next']['href'])
-            payments.extend(next_payments)
-        return payments
-
-    # Fetch data for settlement refund
+        """ Fetch payments of the settlement from mollie api"""
+        return self._api_iter_settlement_items(settlement_id, 'payments')
+
     def _api_get_settlement_refunds(self, settlement_id):
-        """ Fetch settlements data from mollie api"""
-        api_endpoint = "https://api.mollie.com/v2/settlements/%s/refunds?embed=payment&limit=250" % settlement_id
-        refund_data = self._api_call_refunds_recursive(api_endpoint)
-        return refund_data
-
-    def _api_call_refunds_recursive(self, api_endpoint):
-        refunds = []
-        refund_data = self._mollie_api_call(api_endpoint)
-        if refund_data and refund_data['count'] > 0:
-            refunds.extend(refund_data['_embedded']['refunds'])
-        if refund_data["_links"]['next']:
-            next_refunds = self._api_call_refunds_recursive(refund_data["_links"]['next']['href'])
-            refunds.extend(next_refunds)
-        return refunds
-
-    # Fetch data for settlement capture
+        """ Fetch refunds of the settlement from mollie api"""
+        return self._api_iter_settlement_items(settlement_id, 'refunds')
+
     def _api_get_settlement_captures(self, settlement_id):
-        """ Fetch settlements data from mollie api"""
-        api_endpoint = "https://api.mollie.com/v2/settlements/%s/captures?embed=payment" % settlement_id
-        capture_data = self._api_call_captures_recursive(api_endpoint)
-        return capture_data
-
-    def _api_call_captures_recursive(self, api_endpoint):
-        captures = []
-        capture_data = self._mollie_api_call(api_endpoint)
-        if capture_data and capture_data['count'] > 0:
-            captures.extend(capture_data['_embedded']['captures'])
-        if capture_data["_links"]['next']:
-            next_captures = self._api_call_captures_recursive(capture_data["_links"]['next']['href'])
-            captures.extend(next_captures)
-        return captures
-
-    # Fetch data for settlement chargeback
+        """ Fetch captures of the settlement from mollie api"""
+        return self._api_iter_settlement_items(settlement_id, 'captures')
+
     def _api_get_settlement_chargebacks(self, settlement_id):
-        """ Fetch settlements data from mollie api"""
-        api_endpoint = "https://api.mollie.com/v2/settlements/%s/chargebacks?embed=payment&limit=250" % settlement_id
-        capture_data = self._api_call_chargebacks_recursive(api_endpoint)
-        return capture_data
-
-    def _api_call_chargebacks_recursive(self, api_endpoint):
-        chargebacks = []
-        chargeback_data = self._mollie_api_call(api_endpoint)
-        if chargeback_data and chargeback_data['count'] > 0:
-            chargebacks.extend(chargeback_data['_embedded']['chargebacks'])
-        if chargeback_data["_links"]['next']:
-            next_chargebacks = self._api_call_chargebacks_recursive(chargeback_data["_links"]['next']['href'])
-            chargebacks.extend(next_chargebacks)
-        return chargebacks
+        """ Fetch chargebacks of the settlement from mollie api"""
+        return self._api_iter_settlement_items(settlement_id, 'chargebacks')
+
+    def _api_iter_settlement_items(self, settlement_id, resource):
+        api_endpoint = self._mollie_api_url(SETTLEMENT_ENDPOINTS[resource] % settlement_id)
+        return self._mollie_api_iter(api_endpoint, resource, prefetch=PREFETCH_NEXT_PAGE)
 
     def _api_call_get_order_meta(self, order_id):
-        api_endpoint = "https://api.mollie.com/v2/orders/%s" % order_id
+        api_endpoint = self._mollie_api_url("/v2/orders/%s" % order_id)
         order = self._mollie_api_call(api_endpoint)
         data = {}
         if order.get('metadata'):
@@ -306,16 +454,37 @@ class AccountJournal(models.Model):
             api_key += 'Bearer '
         return api_key + self.mollie_api_key
 
-    def _mollie_api_call(self, api_endpoint):
-        headers = {
+    def _mollie_api_url(self, path):
+        base_url = self.env['ir.config_parameter'].sudo().get_param('mollie_account_sync.api_endpoint') or API_ENDPOINT
+        return base_url.rstrip('/') + path
+
+    def _mollie_api_headers(self):
+        return {
             'content-type': 'application/json',
             'Authorization': self._get_mollie_api_key()
         }
-        _logger.info('Mollie SYNC CALL on: %s', api_endpoint)
+
+    def _mollie_request_executor(self):
+        """ Executor (token bucket, retries and circuit breaker) is shared by all
+            the calls made with the API key in this worker.
+        """
+        key = self._get_mollie_api_key(bearer=False)
+        with _request_executors_lock:
+            if key not in _request_executors:
+                _request_executors[key] = RequestExecutor(rate=RATE_LIMIT, metrics=api_metrics, service='account_sync')
+            return _request_executors[key]
+
+    def _mollie_api_call(self, api_endpoint):
+        try:
+            return _mollie_http_get(api_endpoint, self._mollie_api_headers(), self._mollie_request_executor())
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+            _logger.error('Mollie SYNC issue: %s', e)
+            raise UserError(_('Some thing went wrong please try again after some time.'))
+
+    def _mollie_api_iter(self, api_endpoint, resource, prefetch=False):
+        """ Paginated version of `_mollie_api_call` that yields embedded items """
         try:
-            req = requests.get(api_endpoint, timeout=TIMEOUT, headers=headers)
-            req.raise_for_status()
-            return req.json()
+            yield from _mollie_iter_items(api_endpoint, resource, self._mollie_api_headers(), self._mollie_request_executor(), prefetch=prefetch)
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
             _logger.error('Mollie SYNC issue: %s', e)
             raise UserError(_('Some thing went wrong please try again after some time.'))
@@ -365,10 +534,14 @@ class AccountJournal(models.Model):
             'lines': lines
         }
 
-    def _parse_payment_metadata(self, payment, tx_type):
+    def _parse_payment_metadata(self, payment, tx_type, resolve_partner=True):
+        """ Prepare mollie info of statement line from payment data.
+
+            :param resolve_partner: search partner of the payment transaction. Pass
+                False when partners are resolved in batch with `_mollie_set_lines_partner`.
+        """
 
         json_info = {}
-        mollie_acquirer = self.env.ref('payment_mollie_official.payment_acquirer_mollie', raise_if_not_found=False)
         statement_line_data = {}
 
         if payment.get('metadata'):
@@ -379,15 +552,34 @@ class AccountJournal(models.Model):
             json_info['MollieType'] = tx_type
             statement_line_data['mollie_json_info'] = json.dumps(json_info)
 
-        domain = [('acquirer_reference', '=', payment['id'])]
-        if mollie_acquirer:
-            domain += [('acquirer_id', '=', mollie_acquirer.id)]
-        transaction = self.env['payment.transaction'].search(domain, limit=1)
-        if transaction and transaction.partner_id:
-            statement_line_data['partner_id'] = transaction.partner_id.id
+        if resolve_partner:
+            partner_id = self._mollie_get_partners_by_payment_ids([payment['id']]).get(payment['id'])
+            if partner_id:
+                statement_line_data['partner_id'] = partner_id
 
         return statement_line_data
 
+    def _mollie_set_lines_partner(self, partner_lines):
+        """ Set partner on statement line values based on mollie payment ids.
+
+            :param partner_lines: list of tuple (statement line values, mollie payment id)
+        """
+        partners = self._mollie_get_partners_by_payment_ids([payment_id for _line, payment_id in partner_lines])
+        for statement_line, payment_id in partner_lines:
+            if partners.get(payment_id):
+                statement_line['partner_id'] = partners[payment_id]
+
+    def _mollie_get_partners_by_payment_ids(self, payment_ids):
+        """ Returns dict of mollie payment id -> partner id of the odoo transaction.
+            Transactions are searched by chunks with one query per chunk.
+        """
+        result = {}
+        # Same transaction as `search(limit=1)` is used when multiple transactions have same reference
+        for transaction in self.env['payment.transaction']._mollie_get_by_mollie_ids(payment_ids):
+            if transaction.acquirer_reference not in result:
+                result[transaction.acquirer_reference] = transaction.partner_id.id
+        return result
+
 
 class AccountBankStatement(models.Model):
     _inherit = "account.bank.statement"
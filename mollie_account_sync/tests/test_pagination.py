@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.mollie_account_sync.models.account_journal import _mollie_iter_items, _mollie_stream_items
+from odoo.addons.payment_mollie_official.tools import FakeMollieServer, RequestExecutor
+from odoo.addons.payment_mollie_official.tools.benchmark_scenarios import paginated
+
+PAYMENTS_PATH = '/v2/settlements/stl_test/payments'
+
+
+class TestPagination(BaseCase):
+
+    def _iter_payments(self, count, **kwargs):
+        """ Ids of the settlement payments read page by page, with the number of pages requested """
+        responses = {}
+        with FakeMollieServer(responses) as server:
+            responses[('GET', PAYMENTS_PATH)] = paginated(server.url, 'payments', count, lambda index, path: {'id': 'tr_%s' % index}, page_size=100)
+            items = _mollie_iter_items(server.url + PAYMENTS_PATH + '?limit=250', 'payments', {}, RequestExecutor(rate=1000), **kwargs)
+            ids = [item['id'] for item in items]
+        return ids, server.calls[('GET', PAYMENTS_PATH)]
+
+    def test_pages(self):
+        ids, pages = self._iter_payments(250)
+        self.assertEqual(ids, ['tr_%s' % index for index in range(250)])
+        self.assertEqual(pages, 3, "Page size is capped by the API, next pages are followed with `_links.next`")
+
+    def test_exact_pages(self):
+        ids, pages = self._iter_payments(200)
+        self.assertEqual(len(ids), 200)
+        self.assertEqual(pages, 2, "No page is requested after the last one")
+
+    def test_empty(self):
+        ids, pages = self._iter_payments(0)
+        self.assertEqual(ids, [])
+        self.assertEqual(pages, 1)
+
+    def test_prefetch(self):
+        ids, pages = self._iter_payments(250, prefetch=True)
+        self.assertEqual(ids, ['tr_%s' % index for index in range(250)])
+        self.assertEqual(pages, 3)
+
+    def test_stream(self):
+        responses = {}
+        with FakeMollieServer(responses) as server, ThreadPoolExecutor(max_workers=2) as executor:
+            responses[('GET', PAYMENTS_PATH)] = paginated(server.url, 'payments', 150, lambda index, path: {'id': 'tr_%s' % index}, page_size=100)
+            items = _mollie_stream_items(server.url + PAYMENTS_PATH, 'payments', {}, RequestExecutor(rate=1000), executor)
+            self.assertEqual(len(list(items)), 150)
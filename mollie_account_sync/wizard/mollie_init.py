@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import json
 import logging
 
 from odoo import _, api, fields, models
@@ -31,6 +32,7 @@ class MollieInit(models.TransientModel):
                         'settlement_date': settlement_date,
                         'settlement_id': settlement['id'],
                         'settlement_amount': settlement['amount']['value'],
+                        'settlement_data': json.dumps(settlement),
                     }))
         return result
 
@@ -48,20 +50,10 @@ class MollieInit(models.TransientModel):
         line_to_sync = self.settlement_lines.filtered('do_sync')
         journal = self.journal_id
         if line_to_sync and journal:
-            settlements_data = self.journal_id._api_get_settlements(limit=LIMIT)
-            mollie_ids_to_sync = line_to_sync.mapped('settlement_id')
-
-            new_list = []
-            if settlements_data['count'] == 0:
-                return []
-
-            for settlement in settlements_data['_embedded']['settlements']:
-                if settlement['id'] in mollie_ids_to_sync:
-                    new_list.append(settlement)
-            settlements_data['_embedded']['settlements'] = new_list
-            settlements_data['count'] = len(new_list)
-            if new_list:
-                journal._process_settlements(settlements_data)
+            # Settlement data is kept on lines so we do not need to fetch settlements again
+            settlements = [json.loads(line.settlement_data) for line in line_to_sync if line.settlement_data]
+            if settlements:
+                journal._process_settlements({'count': len(settlements), '_embedded': {'settlements': settlements}})
                 journal.mollie_last_sync = fields.Datetime.now()
 
 
@@ -75,3 +67,4 @@ class MollieInitLines(models.TransientModel):
     settlement_id = fields.Char()
     settlement_amount = fields.Float()
     do_sync = fields.Boolean(string="Sync")
+    settlement_data = fields.Text()
@@ -1,6 +1,6 @@
 {
     'name': 'Mollie Pos Terminal',
-    'version': '14.0.0.1',
+    'version': '14.0.0.2',
     'description': '',
     'summary': 'Connect your pos with mollie terminal',
     'author': 'Mollie',
@@ -9,6 +9,8 @@
     'category': '',
     'depends': [
         'point_of_sale',
+        'bus',
+        'payment_mollie_official',
     ],
     'data': [
         'security/ir.model.access.csv',
@@ -18,6 +20,7 @@
         'views/res_config_settings_views.xml',
         'views/pos_payment_method_views.xml',
         'wizard/mollie_sync_terminal.xml',
+        'data/cron.xml',
     ],
     'qweb': [
         'static/src/views/*.xml',
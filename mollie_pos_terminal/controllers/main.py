@@ -2,8 +2,11 @@
 import logging
 import json
 from odoo import fields, http
+from odoo.exceptions import AccessError
 from odoo.http import request
 
+from odoo.addons.bus.controllers.main import BusController
+
 _logger = logging.getLogger(__name__)
 
 
@@ -15,3 +18,22 @@ class PosMollieController(http.Controller):
             return
         request.env['mollie.pos.terminal.payments']._mollie_process_webhook(post)
         return ""
+
+
+class MollieBusController(BusController):
+
+    def _poll(self, dbname, channels, last, options):
+        """ Subscribe the POS to the private channel of its session. Clients can only
+            subscribe to string channels, the session is checked with the user rights.
+        """
+        pos_session_id = options.get('mollie_pos_session_id')
+        if request.session.uid and pos_session_id:
+            pos_session = request.env['pos.session'].browse(int(pos_session_id)).exists()
+            try:
+                pos_session.check_access_rights('read')
+                pos_session.check_access_rule('read')
+            except AccessError:
+                pos_session = False
+            if pos_session:
+                channels = list(channels) + [request.env['mollie.pos.terminal.payments']._mollie_bus_channel(pos_session.id)]
+        return super()._poll(dbname, channels, last, options)
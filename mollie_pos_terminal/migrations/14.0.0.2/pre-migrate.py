@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """ Unique constraints on transaction id and mollie uid are only created when
+        the table has no duplicates, otherwise odoo logs a warning and the lookups
+        stay unindexed. Latest payment keeps the value, older duplicates get
+        their id appended so they can still be found.
+    """
+    if not version:
+        return
+    for column in ['name', 'mollie_uid']:
+        cr.execute("""
+            UPDATE mollie_pos_terminal_payments payment
+               SET {column} = payment.{column} || '-duplicate-' || payment.id
+             WHERE payment.{column} IS NOT NULL
+               AND EXISTS (SELECT 1 FROM mollie_pos_terminal_payments other
+                            WHERE other.{column} = payment.{column} AND other.id > payment.id)
+        """.format(column=column))
+        if cr.rowcount:
+            _logger.warning('Mollie POS Terminal: %s payments with duplicated %s renamed before adding unique constraint', cr.rowcount, column)
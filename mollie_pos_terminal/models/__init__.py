@@ -3,3 +3,5 @@ from . import res_config_settings
 from . import pos_payment_method
 from . import mollie_pos_terminal
 from . import mollie_pos_terminal_payments
+from . import mollie_pos_terminal_payments_archive
+from . import mollie_webhook_queue
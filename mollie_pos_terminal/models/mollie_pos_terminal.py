@@ -1,12 +1,24 @@
+import functools
 import logging
 import requests
+import threading
 from werkzeug import urls
 
 from odoo import fields, models, _
 from odoo.exceptions import ValidationError
 
+from odoo.addons.payment_mollie_official.tools import RequestExecutor, api_metrics
+
 _logger = logging.getLogger(__name__)
 
+RATE_LIMIT = 10     # max API calls started per second for one API key
+MAX_RETRIES = 2     # keep it low, cashier is waiting
+
+API_ENDPOINT = 'https://api.mollie.com/'    # can be changed with `mollie_pos_terminal.api_endpoint` system parameter (local stand-in for benchmarks)
+
+_request_executors = {}
+_request_executors_lock = threading.Lock()
+
 
 class MolliePosTerminal(models.Model):
     _name = 'mollie.pos.terminal'
@@ -25,39 +37,77 @@ class MolliePosTerminal(models.Model):
     company_id = fields.Many2one('res.company', required=True, default=lambda self: self.env.company)
 
     def _sync_mollie_terminals(self):
-        existing_terminals = self.search([])
-        terminals_data = self._api_get_terminals()  # TODO: manage pager for 250+ terminals
-
-        if not terminals_data.get('count'):
+        """ Create or update terminals of the current company from all the pages
+            of mollie terminal list. Only the terminals having changes are written.
+        """
+        terminals = list(self._api_iter_terminals())
+        if not terminals:
             return
 
-        for terminal in terminals_data['_embedded']['terminals']:
-            terminal_found = existing_terminals.filtered(lambda x: x.terminal_id == terminal['id'])
-            currency = self.env['res.currency'].search([('name', '=', terminal['currency'])])
+        currency_codes = {terminal['currency'] for terminal in terminals}
+        currencies = {currency.name: currency.id for currency in self.env['res.currency'].search([('name', 'in', list(currency_codes))])}
+        missing_currencies = currency_codes - set(currencies)
+        if missing_currencies:
+            raise ValidationError(_('Currency ') + ', '.join(sorted(missing_currencies)) + _(' is not active. Please activate it first.'))
 
-            if not currency:
-                raise ValidationError(_('Currency ') + terminal['currency'] + _(' is not active. Please activate it first.'))
+        existing_terminals = {terminal.terminal_id: terminal for terminal in self.search([('terminal_id', 'in', [terminal['id'] for terminal in terminals])])}
 
+        to_create = []
+        for terminal in terminals:
             terminal_data = {
                 'name': terminal['description'],
                 'terminal_id': terminal['id'],
                 'profile_id': terminal['profileId'],
                 'serial_number': terminal['serialNumber'],
                 'status': terminal['status'],
-                'currency_id': currency.id
+                'currency_id': currencies[terminal['currency']]
             }
-            if terminal_found:
-                terminal_found.write(terminal_data)
-            else:
-                self.create(terminal_data)
+            terminal_found = existing_terminals.get(terminal['id'])
+            if not terminal_found:
+                to_create.append(terminal_data)
+                continue
+            # api sends null where odoo reads False
+            changes = {
+                field: value for field, value in terminal_data.items()
+                if ((terminal_found[field].id if field == 'currency_id' else terminal_found[field]) or False) != (value or False)
+            }
+            if changes:
+                terminal_found.write(changes)
+        if to_create:
+            self.create(to_create)
+
+    def _cron_sync_mollie_terminals(self):
+        """ Sync terminals of all the companies having terminal API key """
+        for company in self.env['res.company'].search([('mollie_terminal_api_key', '!=', False)]):
+            try:
+                self.with_company(company)._sync_mollie_terminals()
+                self.env.cr.commit()
+            except ValidationError as e:
+                self.env.cr.rollback()
+                _logger.error('Mollie POS Terminal sync failed for company %s: %s', company.name, e)
+        return True
 
     # =================
     # API CALLS METHODS
     # =================
 
-    def _api_get_terminals(self):
+    def _api_get_terminals(self, endpoint='/terminals?limit=250'):
         """ Fetch terminals data from mollie api """
-        return self._mollie_api_call('/terminals', method='GET')
+        return self._mollie_api_call(endpoint, method='GET')
+
+    def _api_iter_terminals(self):
+        """ Yield terminals of all the pages following `_links.next` """
+        endpoint = '/terminals?limit=250'
+        while endpoint:
+            terminals_data = self._api_get_terminals(endpoint)
+            if terminals_data.get('count'):
+                yield from terminals_data['_embedded']['terminals']
+            next_link = terminals_data.get('_links', {}).get('next')
+            endpoint = False
+            if next_link:
+                # next link is absolute url on /v2, `_mollie_api_call` expects path relative to it
+                next_url = urls.url_parse(next_link['href'])
+                endpoint = '%s?%s' % (next_url.path.split('/v2', 1)[-1], next_url.query)
 
     def _api_make_payment_request(self, data):
         payment_payload = self._prepare_payment_payload(data)
@@ -95,23 +145,14 @@ class MolliePosTerminal(models.Model):
     # =====================
 
     def _mollie_api_call(self, endpoint, data=None, method='POST', silent=False):
-        company = self.company_id or self.env.company
-
-        headers = {
-            'content-type': 'application/json',
-            "Authorization": f'Bearer {company.mollie_terminal_api_key}',
-        }
-
-        endpoint = f'/v2/{endpoint.strip("/")}'
-        url = urls.url_join('https://api.mollie.com/', endpoint)
+        url, send_request = self._mollie_prepare_api_request(endpoint, data=data, method=method)
 
         _logger.info('Mollie POS Terminal CALL on: %s', url)
 
         try:
-            response = requests.request(method, url, json=data, headers=headers, timeout=60)
-            response.raise_for_status()
-        except requests.exceptions.HTTPError:
-            error_details = response.json()
+            response = send_request()
+        except requests.exceptions.HTTPError as e:
+            error_details = e.response.json()
             _logger.exception("MOLLIE-POS-ERROR \n %s", error_details)
             if silent:
                 return error_details
@@ -125,6 +166,31 @@ class MolliePosTerminal(models.Model):
                 raise ValidationError("Mollie: " + _("Some thing went wrong."))
         return response.json()
 
+    def _mollie_prepare_api_request(self, endpoint, data=None, method='POST'):
+        """ Returns url and callable sending the request. Callable does not use
+            the ORM so it can be called from worker threads, it raises requests exceptions.
+        """
+        company = self.company_id or self.env.company
+
+        headers = {
+            'content-type': 'application/json',
+            "Authorization": f'Bearer {company.mollie_terminal_api_key}',
+        }
+
+        endpoint = f'/v2/{endpoint.strip("/")}'
+        api_endpoint = self.env['ir.config_parameter'].sudo().get_param('mollie_pos_terminal.api_endpoint') or API_ENDPOINT
+        url = urls.url_join(api_endpoint, endpoint)
+
+        requester = self._mollie_request_executor(company.mollie_terminal_api_key)
+        return url, functools.partial(requester.request, method, url, json=data, headers=headers, timeout=60)
+
+    def _mollie_request_executor(self, api_key):
+        """ Executor (token bucket, retries and circuit breaker) shared by all the calls of the API key in this worker """
+        with _request_executors_lock:
+            if api_key not in _request_executors:
+                _request_executors[api_key] = RequestExecutor(rate=RATE_LIMIT, max_retries=MAX_RETRIES, max_backoff=5, metrics=api_metrics, service='pos_terminal')
+            return _request_executors[api_key]
+
     def show_form_and_tree(self):
         action = self.env['ir.actions.actions']._for_xml_id('mollie_pos_terminal.mollie_pos_terminal_payments_action')
         action.update({
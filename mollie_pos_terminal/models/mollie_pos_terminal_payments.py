@@ -1,6 +1,10 @@
 import json
 import logging
 import requests
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from werkzeug import urls
 
 from odoo import fields, models, api, _
@@ -8,6 +12,23 @@ from odoo.exceptions import ValidationError
 
 _logger = logging.getLogger(__name__)
 
+# Mollie does not change these statuses anymore
+FINAL_STATUSES = ['paid', 'failed', 'expired', 'canceled']
+
+
+# Fields of the status returned to the POS, full response is never sent
+STATUS_FIELDS = ['name', 'mollie_uid', 'status']
+
+RECONCILE_AFTER = 300       # seconds, can be changed with `mollie_pos_terminal.reconcile_after` system parameter
+RECONCILE_BATCH_SIZE = 500
+RECONCILE_WORKERS = 4
+RECONCILE_MAX_AGE_DAYS = 7  # can be changed with `mollie_pos_terminal.reconcile_max_age_days` system parameter
+GONE_STATUS_CODES = (404, 410)  # payment unknown to mollie, refreshing it again will never succeed
+
+ARCHIVE_AFTER_DAYS = 90     # can be changed with `mollie_pos_terminal.response_retention_days` system parameter
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_TIME_BUDGET = 15 * 60
+
 
 class MolliePosTerminal(models.Model):
     _name = 'mollie.pos.terminal.payments'
@@ -16,7 +37,11 @@ class MolliePosTerminal(models.Model):
     name = fields.Char("Transaction ID")
     mollie_uid = fields.Char("Mollie UID")
     terminal_id = fields.Many2one('mollie.pos.terminal')
-    mollie_latest_response = fields.Text('Response', default="{}")
+    pos_session_id = fields.Many2one('pos.session', string="POS Session")
+    amount = fields.Float()
+    currency = fields.Char()
+    # not prefetched so status lookups do not load the whole json
+    mollie_latest_response = fields.Text('Response', default="{}", prefetch=False)
     status = fields.Selection([
         ('open', 'Open'),
         ('paid', 'Paid'),
@@ -24,7 +49,15 @@ class MolliePosTerminal(models.Model):
         ('expired', 'Expired'),
         ('canceled', 'Canceled'),
         ('pending', 'Pending'),
-    ], default='open')
+    ], default='open', index=True)
+    mollie_response = fields.Text('Mollie Response', compute='_compute_mollie_response')
+    mollie_last_checked_at = fields.Datetime('Last Checked', default=fields.Datetime.now, readonly=True, copy=False,
+                                             help="Last status refresh by the reconciliation, oldest ones are refreshed first.")
+
+    _sql_constraints = [
+        ('name_uniq', 'unique(name)', 'Mollie transaction must be unique!'),
+        ('mollie_uid_uniq', 'unique(mollie_uid)', 'Mollie UID must be unique!'),
+    ]
 
     def _create_mollie_payment_request(self, response, data):
         if response and response.get('status') == 'open':
@@ -32,8 +65,11 @@ class MolliePosTerminal(models.Model):
                 'name': response.get('id'),
                 'mollie_uid': data.get('mollie_uid'),
                 'terminal_id': data.get('terminal_id'),
+                'pos_session_id': data.get('pos_session_id'),
                 'mollie_latest_response': json.dumps(response or {}),
-                'status': response.get('status')
+                'status': response.get('status'),
+                'amount': float((response.get('amount') or {}).get('value') or 0.0),
+                'currency': (response.get('amount') or {}).get('currency'),
             })
 
     @api.model
@@ -45,10 +81,15 @@ class MolliePosTerminal(models.Model):
             domain.append(('mollie_uid', '=', mollie_uid))
         else:
             return {}
-        mollie_payment = self.search(domain, limit=1)
-        if mollie_payment:
-            return json.loads(mollie_payment.mollie_latest_response or '{}')
-        return {}
+        payments = self.search_read(domain, STATUS_FIELDS, limit=1)
+        return self._mollie_status_projection(payments[0]) if payments else {}
+
+    def _mollie_status_projection(self, payment):
+        return {
+            'id': payment['name'],
+            'mollie_uid': payment['mollie_uid'],
+            'status': payment['status'],
+        }
 
     @api.model
     def mollie_cancel_payment_request(self, transaction_id=None, mollie_uid=None):
@@ -65,11 +106,178 @@ class MolliePosTerminal(models.Model):
         return {}
 
     def _mollie_process_webhook(self, webhook_data):
+        """ Notification is stored in the webhook queue of payment module, repeated
+            notifications are coalesced there and processed by its cron.
+        """
         mollie_payment = self.sudo().search([('name', '=', webhook_data.get('id'))], limit=1)
         if mollie_payment:
-            payment_status = mollie_payment.terminal_id._api_get_mollie_payment_status(webhook_data.get('id'))
-            if payment_status and payment_status.get('status'):
-                mollie_payment.write({
-                    'mollie_latest_response': json.dumps(payment_status or {}),
-                    'status': payment_status.get('status')
-                })
+            self.env['mollie.webhook.queue'].sudo()._mollie_enqueue(mollie_payment, mollie_payment.name)
+
+    def _mollie_process_notification(self):
+        """ Fetch latest status from mollie and push it to the POS, called from webhook queue.
+
+            :return: False if fetch was not needed because payment is already in final state
+        """
+        self.ensure_one()
+        if self.status in FINAL_STATUSES:
+            return False
+        payment_status = self.terminal_id._api_get_mollie_payment_status(self.name)
+        if not (payment_status and payment_status.get('status')):
+            raise ValidationError(_('Mollie: unable to fetch the status of payment %s: %s') % (self.name, payment_status))
+        self.write({
+            'mollie_latest_response': json.dumps(payment_status),
+            'status': payment_status.get('status')
+        })
+        self._mollie_notify_pos_session(payment_status)
+        return True
+
+    def _mollie_bus_channel(self, pos_session_id):
+        """ Private channel of POS session, only added by the bus controller for
+            users allowed to read the session (see `MollieBusController`).
+        """
+        return (self.env.cr.dbname, self._name, pos_session_id)
+
+    def _mollie_notify_pos_session(self, payment_status):
+        """ Push the new status to the POS that requested the payment.
+            Only the fields used by the POS are sent, not the full response.
+        """
+        notifications = [
+            [self._mollie_bus_channel(payment.pos_session_id.id), {
+                'mollie_uid': payment.mollie_uid,
+                'id': payment.name,
+                'status': payment_status.get('status'),
+                'detail': payment_status.get('detail'),
+            }]
+            for payment in self if payment.pos_session_id
+        ]
+        if notifications:
+            self.env['bus.bus'].sudo().sendmany(notifications)
+
+    @api.model
+    def _cron_reconcile_open_payments(self):
+        """ Refresh open and pending payments for which no webhook was received.
+
+            Statuses are fetched concurrently (rate limited by the request executor
+            of each API key) and the payments are updated with one write per new
+            status. Only the status is updated, `mollie_latest_response` keeps the
+            last response received by the webhook.
+
+            Payments checked the longest time ago are refreshed first so payments
+            failing on every refresh do not starve the others. Payments unknown to
+            mollie (404/410) or older than the max age are marked as expired.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        reconcile_after = int(ICP.get_param('mollie_pos_terminal.reconcile_after', RECONCILE_AFTER))
+        max_age_days = int(ICP.get_param('mollie_pos_terminal.reconcile_max_age_days', RECONCILE_MAX_AGE_DAYS))
+        now = fields.Datetime.now()
+
+        too_old = self.search([
+            ('status', 'in', ['open', 'pending']),
+            ('create_date', '<', now - timedelta(days=max_age_days)),
+        ])
+        if too_old:
+            _logger.info('Mollie POS Terminal: %s payments not reconciled after %s days are expired', len(too_old), max_age_days)
+            too_old.write({'status': 'expired', 'mollie_last_checked_at': now})
+            too_old._mollie_notify_pos_session({'status': 'expired'})
+
+        payments = self.search([
+            ('status', 'in', ['open', 'pending']),
+            ('create_date', '<', now - timedelta(seconds=reconcile_after)),
+            ('terminal_id', '!=', False),
+        ], order='mollie_last_checked_at, id', limit=RECONCILE_BATCH_SIZE)
+        if not payments:
+            return True
+
+        # requests are prepared in main thread, threads only do the HTTP calls
+        send_requests = {payment: payment.terminal_id._mollie_prepare_api_request(f'/payments/{payment.name}', method='GET')[1] for payment in payments}
+        valid_statuses = dict(self._fields['status'].selection)
+        to_update = defaultdict(lambda: self.browse())
+        with ThreadPoolExecutor(max_workers=RECONCILE_WORKERS) as executor:
+            futures = {payment: executor.submit(send_request) for payment, send_request in send_requests.items()}
+            for payment, future in futures.items():
+                try:
+                    status = future.result().json().get('status')
+                except requests.exceptions.HTTPError as e:
+                    if e.response is not None and e.response.status_code in GONE_STATUS_CODES:
+                        _logger.info('Mollie POS Terminal: payment %s not found on mollie, marked as expired', payment.name)
+                        to_update['expired'] |= payment
+                    else:
+                        _logger.warning('Mollie POS Terminal: unable to refresh payment %s: %s', payment.name, e)
+                    continue
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    _logger.warning('Mollie POS Terminal: unable to refresh payment %s: %s', payment.name, e)
+                    continue
+                if status in valid_statuses and status != payment.status:
+                    to_update[status] |= payment
+
+        payments.write({'mollie_last_checked_at': now})
+        for status, status_payments in to_update.items():
+            status_payments.write({'status': status})
+            status_payments._mollie_notify_pos_session({'status': status})
+        return True
+
+    def _compute_mollie_response(self):
+        """ Latest mollie response, from the archive when it is archived """
+        archives = self.env['mollie.pos.terminal.payments.archive'].search([('payment_id', 'in', self.ids)])
+        archive_by_payment = {archive.payment_id.id: archive for archive in archives}
+        for payment in self:
+            if payment.mollie_latest_response:
+                payment.mollie_response = payment.mollie_latest_response
+            elif payment.id in archive_by_payment:
+                payment.mollie_response = archive_by_payment[payment.id]._mollie_get_response()
+            else:
+                payment.mollie_response = False
+
+    @api.model
+    def _cron_archive_responses(self):
+        """ Move the raw responses of finished payments older than the retention
+            period to the compressed archive, only status, amount and ids stay
+            on the payment.
+
+            Rows are processed in small batches locked with `SKIP LOCKED` and
+            committed one by one so the POS is never blocked by the archival.
+            Amount and currency are read from the responses in python so one
+            invalid response can not block the archival of the others.
+        """
+        retention_days = int(self.env['ir.config_parameter'].sudo().get_param('mollie_pos_terminal.response_retention_days', ARCHIVE_AFTER_DAYS))
+        limit_date = fields.Datetime.now() - timedelta(days=retention_days)
+        Archive = self.env['mollie.pos.terminal.payments.archive']
+        deadline = time.monotonic() + ARCHIVE_TIME_BUDGET
+        while time.monotonic() < deadline:
+            self.env.cr.execute("""
+                SELECT id, name, mollie_latest_response, amount, currency FROM mollie_pos_terminal_payments
+                 WHERE mollie_latest_response IS NOT NULL AND status IN %s AND create_date < %s
+                 ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (tuple(FINAL_STATUSES), limit_date, ARCHIVE_BATCH_SIZE))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            archive_vals = []
+            for payment_id, name, response, amount, currency in rows:
+                if response.strip() in ('', '{}'):
+                    continue
+                # invalid json is archived as is, only the amount can not be read from it
+                archive_vals.append({'payment_id': payment_id, 'name': name, 'response': Archive._mollie_compress_response(response)})
+                if amount and currency:
+                    continue
+                try:
+                    response_amount = json.loads(response).get('amount') or {}
+                    value = float(response_amount.get('value') or 0.0)
+                except (ValueError, TypeError, AttributeError):
+                    _logger.warning('Mollie POS Terminal: amount not found in invalid response of payment %s', name)
+                    continue
+                self.env.cr.execute("""
+                    UPDATE mollie_pos_terminal_payments
+                       SET amount = COALESCE(amount, %s), currency = COALESCE(currency, %s)
+                     WHERE id = %s
+                """, (value, response_amount.get('currency'), payment_id))
+            Archive.create(archive_vals)
+            payment_ids = tuple(row[0] for row in rows)
+            self.env.cr.execute("""
+                UPDATE mollie_pos_terminal_payments SET mollie_latest_response = NULL WHERE id IN %s
+            """, (payment_ids,))
+            self.invalidate_cache(['mollie_latest_response', 'amount', 'currency'], list(payment_ids))
+            self.env.cr.commit()
+        return True
@@ -0,0 +1,23 @@
+import base64
+import zlib
+
+from odoo import fields, models
+
+
+class MolliePosTerminalPaymentsArchive(models.Model):
+    _name = 'mollie.pos.terminal.payments.archive'
+    _description = 'Mollie Pos Terminal Payment Archived Response'
+
+    payment_id = fields.Many2one('mollie.pos.terminal.payments', required=True, index=True, ondelete='cascade')
+    name = fields.Char("Transaction ID")
+    response = fields.Binary('Compressed Response', attachment=False)
+
+    def _mollie_compress_response(self, response):
+        return base64.b64encode(zlib.compress(response.encode(), 9))
+
+    def _mollie_get_response(self):
+        """ Raw response text as it was stored on the payment """
+        self.ensure_one()
+        if not self.response:
+            return False
+        return zlib.decompress(base64.b64decode(self.response)).decode()
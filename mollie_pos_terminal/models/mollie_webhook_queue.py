@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+
+class MollieWebhookQueue(models.Model):
+    _inherit = 'mollie.webhook.queue'
+
+    pos_payment_id = fields.Many2one('mollie.pos.terminal.payments', ondelete='cascade')
+
+    @api.model
+    def _mollie_prepare_event_vals(self, record):
+        if record._name == 'mollie.pos.terminal.payments':
+            return {'pos_payment_id': record.id}
+        return super()._mollie_prepare_event_vals(record)
+
+    def _mollie_get_record(self):
+        return self.pos_payment_id or super()._mollie_get_record()
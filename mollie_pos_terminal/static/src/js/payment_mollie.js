@@ -3,12 +3,17 @@ odoo.define('mollie_pos_terminal.payment', function (require) {
 
 
 var core = require('web.core');
+var env = require('web.env');
 var rpc = require('web.rpc');
 var PaymentInterface = require('point_of_sale.PaymentInterface');
 const { Gui } = require('point_of_sale.Gui');
 
 var _t = core._t;
 
+// Status is pushed on the bus by the webhook, polling is only a fallback when a notification is lost
+var POLLING_INTERVAL = 5500;
+var BUS_POLLING_INTERVAL = 30000;
+
 class UuidGenerator {
     constructor() {
         this.isFastIdStrategy = false;
@@ -72,6 +77,7 @@ const PaymentMollie = PaymentInterface.extend({
             'order_id': order.uid,
             'curruncy': this.pos.currency.name,
             'amount': line.amount,
+            'pos_session_id': this.pos.pos_session.id,
         }
     },
 
@@ -145,13 +151,51 @@ const PaymentMollie = PaymentInterface.extend({
         return Promise.reject(data);
     },
 
+    _mollie_bus_service: function () {
+        return env.services && env.services.bus_service;
+    },
+
+    _mollie_listen_bus: function () {
+        var bus_service = this._mollie_bus_service();
+        if (!bus_service) {
+            return false;
+        }
+        if (!this.mollie_bus_listening) {
+            // private channel of the session is added by the server for this option
+            this.mollie_bus_listening = true;
+            bus_service.updateOption('mollie_pos_session_id', this.pos.pos_session.id);
+            bus_service.onNotification(this, this._on_mollie_notification);
+            bus_service.stopPolling();
+            bus_service.startPolling();
+        }
+        return true;
+    },
+
+    _is_mollie_channel: function (channel) {
+        return Array.isArray(channel) && channel[1] === 'mollie.pos.terminal.payments' && channel[2] === this.pos.pos_session.id;
+    },
+
+    _on_mollie_notification: function (notifications) {
+        var line = this.pending_mollie_line();
+        if (!line || !this.mollie_status_handlers) {
+            return;
+        }
+        for (const [channel, message] of notifications) {
+            if (this._is_mollie_channel(channel) && message.mollie_uid === line.mollieUID) {
+                this._mollie_handle_status(message, line, this.mollie_status_handlers.resolve, this.mollie_status_handlers.reject);
+            }
+        }
+    },
+
     start_mollie_status_polling() {
+        var interval = this._mollie_listen_bus() ? BUS_POLLING_INTERVAL : POLLING_INTERVAL;
         var res = new Promise((resolve, reject) => {
             clearInterval(this.polling);
+            this.mollie_status_handlers = {resolve: resolve, reject: reject};
             this._poll_for_response(resolve, reject);
             this.polling = setInterval(() => {
                 this._poll_for_response(resolve, reject);
-            }, 5500);
+            }, interval);
         });
 
         res.finally(() => {
@@ -183,22 +227,27 @@ const PaymentMollie = PaymentInterface.extend({
                 return this._handle_odoo_connection_failure(data);
             }
             return Promise.reject(data);
-        }).then(function (data) {
-            if (data.status == 'paid') {
-                resolve(true);
-            } else if (data.status == 'expired') {
-                line.set_payment_status('retry');
-                reject();
-            } else if (data.status == 'canceled') {
-                resolve(false);
-            } else if(data.status == 'failed') {
-                resolve(false);
-            }
+        }).then((data) => {
+            this._mollie_handle_status(data, line, resolve, reject);
         });
     },
 
+    _mollie_handle_status: function (data, line, resolve, reject) {
+        if (data.status == 'paid') {
+            resolve(true);
+        } else if (data.status == 'expired') {
+            line.set_payment_status('retry');
+            reject();
+        } else if (data.status == 'canceled') {
+            resolve(false);
+        } else if(data.status == 'failed') {
+            resolve(false);
+        }
+    },
+
     _reset_state: function () {
         this.remaining_polls = 4;
+        this.mollie_status_handlers = null;
         clearInterval(this.polling);
     },
 });
@@ -2,7 +2,7 @@
 
 {
     'name': 'Mollie Shipment Sync',
-    'version': '14.0.0.0',
+    'version': '14.0.0.1',
     'description': '',
     'summary': 'Sync shipment details to mollie payments',
     'author': 'Mollie',
@@ -11,6 +11,7 @@
     'category': '',
     'depends': [
         'sale_management',
+        'sale_stock',
         'payment_mollie_official'
     ],
     'data': [
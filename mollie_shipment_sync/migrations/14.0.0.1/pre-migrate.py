@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """ Consider lines delivered before the update as synced with mollie and
+        create the new column ourselves, otherwise the flag is computed for all
+        the existing orders and every past mollie order is synced again.
+    """
+    if not version:
+        return
+    cr.execute("""
+        ALTER TABLE sale_order_line ADD COLUMN IF NOT EXISTS mollie_qty_shipped numeric;
+    """)
+    cr.execute("""
+        UPDATE sale_order_line line SET mollie_qty_shipped = line.qty_delivered
+          FROM sale_order so
+         WHERE so.id = line.order_id AND so.mollie_need_shipment_sync IS NOT TRUE
+    """)
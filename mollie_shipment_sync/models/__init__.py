@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 
 from . import sale_order
-from . import payment_acquirer
\ No newline at end of file
+from . import payment_acquirer
+from . import stock_move
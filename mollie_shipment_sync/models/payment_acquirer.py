@@ -8,6 +8,17 @@ class PaymentAcquirerMollie(models.Model):
     _inherit = 'payment.acquirer'
 
     mollie_auto_sync_shipment = fields.Boolean()
+    mollie_sync_shipment_on_delivery = fields.Boolean(string="Sync Shipment on Delivery",
+                                                      help="Sync shipment shortly after the delivery instead of waiting for the hourly scheduled action.")
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.get('mollie_sync_shipment_on_delivery'):
+            # orders delivered before the option was enabled are not scheduled by their deliveries
+            orders = self.env['sale.order'].search([('mollie_need_shipment_sync', '=', True), ('mollie_shipment_sync_after', '=', False)])
+            orders.write({'mollie_shipment_sync_after': fields.Datetime.now()})
+            self.env.ref('mollie_shipment_sync.sync_shipment_cron').sudo()._trigger()
+        return res
 
     # -----------------------------------------------
     # Methods that uses to mollie python lib
@@ -1,59 +1,238 @@
 # -*- coding: utf-8 -*-
 
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from mollie.api.error import UnprocessableEntityError
+
 from odoo import _, api, fields, models
 
+_logger = logging.getLogger(__name__)
+
+SHIPMENT_SYNC_BATCH_SIZE = 100
+SHIPMENT_SYNC_WORKERS = 4
+SHIPMENT_SYNC_TIME_BUDGET = 45 * 60     # seconds, can be changed with `mollie_shipment_sync.time_budget` system parameter
+SHIPMENT_SYNC_DEBOUNCE = 120            # seconds, can be changed with `mollie_shipment_sync.debounce` system parameter
+
+
+def _mollie_fetch_order(mollie_client, order_reference):
+    """ Runs in worker thread, must not use the ORM """
+    return mollie_client.orders.get(order_reference)
+
+
+def _mollie_create_shipment(mollie_order, shipment_data):
+    """ Runs in worker thread, must not use the ORM """
+    try:
+        return mollie_order.create_shipment(shipment_data)
+    except UnprocessableEntityError as e:
+        return {'error': str(e)}
+
 
 class SaleOrder(models.Model):
     _inherit = 'sale.order'
 
     mollie_payment = fields.Boolean(compute='_compute_mollie_payment')
     mollie_need_shipment_sync = fields.Boolean(compute='_compute_mollie_need_shipment_sync', store=True)
+    mollie_shipment_sync_after = fields.Datetime(copy=False, readonly=True,
+                                                 help="Shipment is synced after this time, postponed on each delivery of the order.")
 
     def mollie_sync_shipment_data(self):
         transaction = self._mollie_get_valid_transaction()
         if transaction:
             data = transaction.acquirer_id._mollie_get_payment_data(transaction.acquirer_reference)
-            shipment_lines = []
-            if data and data.get('lines'):
-                for mollie_line in data.get('lines'):
-                    mollie_line_metadata = mollie_line.get('metadata')
-                    if mollie_line_metadata:
-                        order_line = self.order_line.filtered(lambda l: l.id == mollie_line_metadata.get('line_id'))
-                        if order_line and order_line.qty_delivered > mollie_line['quantityShipped']:
-                            qty_to_ship = order_line.qty_delivered - mollie_line['quantityShipped']
-                            if qty_to_ship and mollie_line.get('shippableQuantity') >= qty_to_ship:
-                                shipment_lines.append({
-                                    'id': mollie_line['id'],
-                                    'quantity': int(qty_to_ship)    # mollie does not support float values
-                                })
-                if shipment_lines:
-                    transaction.acquirer_id._api_mollie_sync_shipment(transaction.acquirer_reference, {'lines': shipment_lines})
+            shipment_lines = self._mollie_prepare_shipment_lines(data)
+            if shipment_lines:
+                result = transaction.acquirer_id._api_mollie_sync_shipment(transaction.acquirer_reference, {'lines': shipment_lines})
+                if not (isinstance(result, dict) and result.get('error')):
+                    self._mollie_update_qty_shipped(data, shipment_lines)
 
         # For all the cases we will un-mark the sales orders
+        self.recompute(['mollie_need_shipment_sync'], self)
         self.mollie_need_shipment_sync = False
 
+    def _mollie_prepare_shipment_lines(self, mollie_order_data):
+        """ Lines delivered in odoo but not shipped yet on mollie """
+        self.ensure_one()
+        shipment_lines = []
+        if not mollie_order_data or not mollie_order_data.get('lines'):
+            return shipment_lines
+        # only lines delivered after the last sync can have something to ship
+        order_lines = {line.id: line for line in self.order_line if line.qty_delivered > line.mollie_qty_shipped}
+        for mollie_line in mollie_order_data.get('lines'):
+            mollie_line_metadata = mollie_line.get('metadata')
+            if mollie_line_metadata:
+                order_line = order_lines.get(mollie_line_metadata.get('line_id'))
+                if order_line and order_line.qty_delivered > mollie_line['quantityShipped']:
+                    qty_to_ship = order_line.qty_delivered - mollie_line['quantityShipped']
+                    if qty_to_ship and mollie_line.get('shippableQuantity') >= qty_to_ship:
+                        shipment_lines.append({
+                            'id': mollie_line['id'],
+                            'quantity': int(qty_to_ship)    # mollie does not support float values
+                        })
+        return shipment_lines
+
+    def _mollie_update_qty_shipped(self, mollie_order_data, shipment_lines):
+        """ Store quantities shipped on mollie so only new deliveries flag the order again """
+        shipped_now = {line['id']: line['quantity'] for line in shipment_lines}
+        order_lines = {line.id: line for line in self.order_line}
+        for mollie_line in mollie_order_data.get('lines') or []:
+            order_line = order_lines.get((mollie_line.get('metadata') or {}).get('line_id'))
+            if order_line:
+                qty_shipped = mollie_line['quantityShipped'] + shipped_now.get(mollie_line['id'], 0)
+                if order_line.mollie_qty_shipped != qty_shipped:
+                    order_line.mollie_qty_shipped = qty_shipped
+
     def _compute_mollie_payment(self):
+        valid_transactions = self._mollie_get_valid_transactions()
         for order in self:
-            valid_transaction = order._mollie_get_valid_transaction()
-            order.mollie_payment = len(valid_transaction) >= 1
+            order.mollie_payment = order in valid_transactions
 
-    @api.depends('order_line.qty_delivered')
+    @api.depends('order_line.qty_delivered', 'order_line.mollie_qty_shipped')
     def _compute_mollie_need_shipment_sync(self):
+        """ Flag orders having lines delivered but not shipped on mollie yet """
         for order in self:
-            if order.mollie_payment:
-                order.mollie_need_shipment_sync = True
-            else:
-                order.mollie_need_shipment_sync = False
+            order.mollie_need_shipment_sync = order.mollie_payment and any(line.qty_delivered > line.mollie_qty_shipped for line in order.order_line)
+
+    def _mollie_schedule_shipment_sync(self):
+        """ With "Sync Shipment on Delivery" the cron is triggered after the
+            debounce delay, each new delivery of the order postpones its sync
+            so consecutive pickings are sent in one shipment.
+
+            Called from the validation of the deliveries only, the shipment
+            cron updating shipped quantities must not schedule itself again.
+        """
+        acquirer = self.env.ref('payment_mollie_official.payment_acquirer_mollie', raise_if_not_found=False)
+        if not (acquirer and acquirer.sudo().mollie_auto_sync_shipment and acquirer.sudo().mollie_sync_shipment_on_delivery):
+            return
+        orders = self.filtered('mollie_payment')
+        if not orders:
+            return
+        debounce = int(self.env['ir.config_parameter'].sudo().get_param('mollie_shipment_sync.debounce', SHIPMENT_SYNC_DEBOUNCE))
+        sync_after = fields.Datetime.now() + timedelta(seconds=debounce)
+        orders.sudo().write({'mollie_shipment_sync_after': sync_after})
+        self.env.ref('mollie_shipment_sync.sync_shipment_cron').sudo()._trigger(sync_after)
 
     def _mollie_get_valid_transaction(self):
         self.ensure_one()
-        return self.transaction_ids.filtered(lambda t: t.acquirer_id.provider == 'mollie' and t.state in ['authorized', 'done'] and t.acquirer_reference.startswith("ord_"))
+        return self._mollie_get_valid_transactions().get(self, self.env['payment.transaction'])
+
+    def _mollie_get_valid_transactions(self):
+        """ Returns dict of order -> mollie order transactions (authorized or done),
+            transactions of all the orders are resolved with one indexed lookup.
+        """
+        mollie_order_ids = [reference for reference in self.transaction_ids.mapped('acquirer_reference') if reference and reference.startswith('ord_')]
+        transactions = self.env['payment.transaction']._mollie_get_by_mollie_ids(mollie_order_ids).filtered(lambda t: t.state in ['authorized', 'done'])
+        result = {}
+        for order in self:
+            order_transactions = order.transaction_ids & transactions
+            if order_transactions:
+                result[order] = order_transactions
+        return result
 
     def _cron_mollie_sync_shipment(self):
+        """ Sync the flagged orders in batches until all are done or the time
+            budget is spent. Remaining orders keep their flag and the cron is
+            triggered again to resume right away. Orders failing with unexpected
+            error also keep the flag and are retried in next run.
+
+            With "Sync Shipment on Delivery" only the orders scheduled by their
+            deliveries and due are synced, not every flagged order.
+        """
         mollie_acquirer = self.env.ref('payment_mollie_official.payment_acquirer_mollie')
-        if mollie_acquirer.mollie_auto_sync_shipment:
-            orders = self.search([('mollie_need_shipment_sync', '=', True)])
-            for order in orders:
-                order.mollie_sync_shipment_data()
-                self.env.cr.commit()
-        return True
\ No newline at end of file
+        if not mollie_acquirer.mollie_auto_sync_shipment:
+            return True
+
+        time_budget = int(self.env['ir.config_parameter'].sudo().get_param('mollie_shipment_sync.time_budget', SHIPMENT_SYNC_TIME_BUDGET))
+        deadline = time.monotonic() + time_budget
+        if mollie_acquirer.mollie_sync_shipment_on_delivery:
+            domain = [('mollie_shipment_sync_after', '!=', False), ('mollie_shipment_sync_after', '<=', fields.Datetime.now())]
+        else:
+            domain = [('mollie_need_shipment_sync', '=', True)]
+        last_id = 0
+        while True:
+            orders = self.search(domain + [('id', '>', last_id)], order='id', limit=SHIPMENT_SYNC_BATCH_SIZE)
+            if not orders:
+                break
+            last_id = orders[-1].id
+            orders._mollie_sync_shipment_batch()
+            self.env.cr.commit()
+            if time.monotonic() > deadline:
+                _logger.info('Mollie shipment sync: time budget spent, resuming after order %s', last_id)
+                self.env.ref('mollie_shipment_sync.sync_shipment_cron')._trigger()
+                break
+        return True
+
+    def _mollie_sync_shipment_batch(self):
+        """ Sync shipments of the orders with concurrent API calls.
+
+            Mollie orders are fetched in parallel, shipment payloads are built
+            in main thread (ORM is not thread safe) and shipments are created in
+            parallel again. Threads only receive the mollie client and plain data.
+        """
+        # prefetch lines and transactions of the whole batch
+        self.mapped('order_line.qty_delivered')
+        self.mapped('transaction_ids.acquirer_id.provider')
+
+        transactions = {order: order_transactions[0] for order, order_transactions in self._mollie_get_valid_transactions().items()}
+
+        # one client per acquirer, `orders.get` and `create_shipment` do not keep state on the client
+        clients = {}
+        for transaction in transactions.values():
+            if transaction.acquirer_id not in clients:
+                clients[transaction.acquirer_id] = transaction.acquirer_id._api_mollie_get_client()
+
+        synced_orders = self.filtered(lambda order: order not in transactions)
+        with ThreadPoolExecutor(max_workers=SHIPMENT_SYNC_WORKERS) as executor:
+            fetch_futures = {
+                order: executor.submit(_mollie_fetch_order, clients[transaction.acquirer_id], transaction.acquirer_reference)
+                for order, transaction in transactions.items()
+            }
+            shipment_futures = {}
+            for order, future in fetch_futures.items():
+                try:
+                    mollie_order = future.result()
+                except Exception as e:
+                    _logger.warning('Mollie shipment sync: unable to fetch %s for order %s: %s', transactions[order].acquirer_reference, order.name, e)
+                    continue
+                shipment_lines = order._mollie_prepare_shipment_lines(mollie_order)
+                if shipment_lines:
+                    shipment_futures[order] = (executor.submit(_mollie_create_shipment, mollie_order, {'lines': shipment_lines}), mollie_order, shipment_lines)
+                else:
+                    order._mollie_update_qty_shipped(mollie_order, [])
+                    synced_orders |= order
+
+            for order, (future, mollie_order, shipment_lines) in shipment_futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    _logger.warning('Mollie shipment sync: unable to create shipment for order %s: %s', order.name, e)
+                    continue
+                if isinstance(result, dict) and result.get('error'):
+                    _logger.warning('Mollie shipment sync: shipment refused for order %s: %s', order.name, result['error'])
+                    order._mollie_update_qty_shipped(mollie_order, [])
+                else:
+                    order._mollie_update_qty_shipped(mollie_order, shipment_lines)
+                synced_orders |= order
+
+        # recompute first, the flag is set again by the updated quantities when something is not shippable yet
+        self.recompute(['mollie_need_shipment_sync'], synced_orders)
+        synced_orders.write({'mollie_need_shipment_sync': False, 'mollie_shipment_sync_after': False})
+        return synced_orders
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    mollie_qty_shipped = fields.Float(string="Quantity Shipped on Mollie", copy=False, readonly=True, digits='Product Unit of Measure')
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'qty_delivered' in vals:     # manual delivery, stock deliveries are scheduled on validation
+            self._mollie_schedule_shipment_sync()
+        return res
+
+    def _mollie_schedule_shipment_sync(self):
+        """ Schedule shipment sync of the orders having lines delivered but not shipped on mollie """
+        self.filtered(lambda line: line.qty_delivered > line.mollie_qty_shipped).order_id._mollie_schedule_shipment_sync()
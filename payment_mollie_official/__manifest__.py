@@ -29,8 +29,10 @@
         'views/account_payment_register.xml',
         'views/account_move_view.xml',
         'views/product_views.xml',
+        'views/mollie_api_metrics_views.xml',
         'data/payment_acquirer_data.xml',
         'data/update_hook.xml',
+        'data/cron.xml',
     ],
 
     'images': [
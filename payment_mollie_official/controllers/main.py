@@ -36,20 +36,8 @@ class MollieController(http.Controller):
         if post.get('tx'):
             transaction = request.env["payment.transaction"].sudo().browse(int(post.get('tx')))
             if transaction.exists() and transaction.acquirer_reference == post.get('id'):
-                data = transaction.acquirer_id._mollie_get_payment_data(transaction.acquirer_reference)
-                request.env["payment.transaction"].sudo().form_feedback(data, "mollie")
-
-                if transaction.state in ['done', 'cancel']:
-
-                    # We will process the payment from webhook confirmation. payment confirmation might
-                    # be delayed and user might left the screen (may be user paid via QR and left the screen).
-                    # A cron is already there for such confirmation but we will process the order immediately
-                    # because we already got the confirmation and there is no need to wait for cron.
-                    # /!\/!\/!\ Whenever you make changes here check `mollie_manual_payment_validation` method too.
-                    if not transaction.is_processed and transaction.state == 'done':
-                        transaction._post_process_after_done()
-
-                    # We do not need next webhooks if payment is already done or canceled
-                    return Response("OK", status=200)
+                # Notification is processed by the queue cron, we just need to store it.
+                request.env["mollie.webhook.queue"].sudo()._mollie_enqueue(transaction, post.get('id'))
+                return Response("OK", status=200)
 
         return Response("Not Confirmed", status=418)
@@ -10,3 +10,5 @@ from . import product
 from . import res_user
 from . import voucher_lines
 from . import account_payment_register
+from . import mollie_webhook_queue
+from . import mollie_api_metrics
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+from odoo.addons.payment_mollie_official.tools import api_metrics
+from odoo.addons.payment_mollie_official.tools.metrics import LATENCY_BUCKETS
+
+
+class MollieApiMetrics(models.TransientModel):
+    """ Report of the outbound mollie API calls recorded by `api_metrics`.
+
+        Metrics are kept in memory of each worker so the report only shows the
+        calls made by the worker serving the request. Register an exporter on
+        `api_metrics` to aggregate all the workers in external system.
+    """
+    _name = 'mollie.api.metrics'
+    _description = 'Mollie API call metrics'
+    _order = 'total_ms desc'
+
+    service = fields.Char()
+    method = fields.Char()
+    endpoint = fields.Char()
+    caller = fields.Char(help="Odoo method at the origin of the call")
+    count = fields.Integer(string="Calls")
+    errors = fields.Integer(help="Responses with 4xx/5xx status and calls without response")
+    retries = fields.Integer()
+    total_ms = fields.Float(string="Total (ms)", digits=(16, 1))
+    avg_ms = fields.Float(string="Avg (ms)", digits=(16, 1))
+    p50_ms = fields.Float(string="p50 (ms)", digits=(16, 1))
+    p95_ms = fields.Float(string="p95 (ms)", digits=(16, 1))
+    p99_ms = fields.Float(string="p99 (ms)", digits=(16, 1))
+    max_ms = fields.Float(string="Max (ms)", digits=(16, 1))
+    bytes_sent = fields.Integer()
+    bytes_received = fields.Integer()
+    status_codes = fields.Char()
+    histogram = fields.Char(string="Latency Histogram")
+
+    @api.model
+    def action_open_metrics(self):
+        labels = ['<=%sms' % bound for bound in LATENCY_BUCKETS] + ['>%sms' % LATENCY_BUCKETS[-1]]
+        records = self.create([{
+            'service': stats['service'],
+            'method': stats['method'],
+            'endpoint': stats['endpoint'],
+            'caller': stats['caller'],
+            'count': stats['count'],
+            'errors': stats['errors'],
+            'retries': stats['retries'],
+            'total_ms': stats['total'],
+            'avg_ms': stats['avg'],
+            'p50_ms': stats['p50'],
+            'p95_ms': stats['p95'],
+            'p99_ms': stats['p99'],
+            'max_ms': stats['max'],
+            'bytes_sent': stats['bytes_sent'],
+            'bytes_received': stats['bytes_received'],
+            'status_codes': ', '.join('%s: %s' % (status or 'no response', count) for status, count in sorted(stats['status'].items())),
+            'histogram': ', '.join('%s: %s' % (label, count) for label, count in zip(labels, stats['histogram']) if count),
+        } for stats in api_metrics.snapshot()])
+        action = self.env['ir.actions.act_window']._for_xml_id('payment_mollie_official.action_mollie_api_metrics')
+        action['domain'] = [('id', 'in', records.ids)]
+        return action
@@ -41,6 +41,24 @@ class MolliePaymentMethod(models.Model):
 
     mollie_voucher_ids = fields.One2many('mollie.voucher.line', 'method_id', string='Mollie Voucher Config')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        methods = super().create(vals_list)
+        methods.parent_id._mollie_invalidate_methods_eligibility()
+        return methods
+
+    def write(self, vals):
+        acquirers = self.parent_id
+        res = super().write(vals)
+        (acquirers | self.parent_id)._mollie_invalidate_methods_eligibility()
+        return res
+
+    def unlink(self):
+        acquirers = self.parent_id
+        res = super().unlink()
+        acquirers._mollie_invalidate_methods_eligibility()
+        return res
+
     def _mollie_show_creditcard_option(self):
         if self.method_id_code != 'creditcard':
             return False
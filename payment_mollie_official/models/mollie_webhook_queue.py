@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_COALESCE_WINDOW = 2    # seconds, can be changed with `payment_mollie_official.webhook_coalesce_window` system parameter
+
+# Mollie does not resend notifications we answered so failed ones are retried with
+# exponential backoff (1 min, 2 min, 4 min ... capped to 6 hours) for about 3 days.
+WEBHOOK_MAX_ATTEMPTS = 20
+WEBHOOK_RETRY_DELAY = 60
+WEBHOOK_MAX_RETRY_DELAY = 6 * 60 * 60
+
+WEBHOOK_RETENTION_DAYS = 30    # processed notifications, can be changed with `payment_mollie_official.webhook_retention_days` system parameter
+WEBHOOK_VACUUM_BATCH_SIZE = 5000
+
+
+class MollieWebhookQueue(models.Model):
+    """ Inbox of the webhook calls received from mollie.
+
+        Webhook controller only stores the notification and answers mollie
+        immediately. Notifications are processed in batches by the cron, rows
+        are locked with `SKIP LOCKED` so the cron can run in multiple workers.
+
+        Notifications for the same mollie id received within the coalesce window
+        are merged so only one status fetch is done for them.
+
+        Notified record is the transaction by default, other modules add their
+        own record field and extend `_mollie_prepare_event_vals` / `_mollie_get_record`.
+        Records must implement `_mollie_process_notification`.
+    """
+    _name = 'mollie.webhook.queue'
+    _description = 'Mollie webhook queue'
+    _order = 'id'
+
+    transaction_id = fields.Many2one('payment.transaction', ondelete='cascade')
+    mollie_id = fields.Char(required=True, index=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('merged', 'Merged'),     # duplicate of another notification processed in same batch
+        ('skipped', 'Skipped'),   # transaction was already in final state, no fetch needed
+        ('error', 'Error'),
+    ], default='pending', required=True, index=True)
+    coalesced_count = fields.Integer(help="Number of extra notifications merged in this one before processing")
+    attempts = fields.Integer()
+    next_attempt_at = fields.Datetime(help="Failed notification is not processed again before this time")
+    error_message = fields.Text()
+
+    @api.model
+    def _mollie_enqueue(self, record, mollie_id):
+        """ Store notification of `mollie_id` for `record` (transaction or record supported by `_mollie_prepare_event_vals`) """
+        # Merge in pending notification if any. Notification locked by the cron
+        # might be already fetched so we create new one in that case.
+        self.env.cr.execute("""
+            UPDATE mollie_webhook_queue SET coalesced_count = coalesced_count + 1
+             WHERE id = (SELECT id FROM mollie_webhook_queue
+                          WHERE mollie_id = %s AND state = 'pending' AND attempts = 0
+                          ORDER BY id DESC
+                          LIMIT 1
+                            FOR UPDATE SKIP LOCKED)
+         RETURNING id
+        """, (mollie_id,))
+        row = self.env.cr.fetchone()
+        if row:
+            return self.browse(row[0])
+
+        event = self.create(dict(self._mollie_prepare_event_vals(record), mollie_id=mollie_id))
+        # Wake up the cron after coalesce window so notification is processed without waiting next call
+        cron = self.env.ref('payment_mollie_official.mollie_webhook_queue_cron', raise_if_not_found=False)
+        if cron:
+            cron._trigger(at=fields.Datetime.now() + timedelta(seconds=self._mollie_coalesce_window()))
+        return event
+
+    @api.model
+    def _mollie_prepare_event_vals(self, record):
+        return {'transaction_id': record.id}
+
+    def _mollie_get_record(self):
+        """ Record notified by the event """
+        self.ensure_one()
+        return self.transaction_id
+
+    @api.model
+    def _mollie_coalesce_window(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('payment_mollie_official.webhook_coalesce_window', WEBHOOK_COALESCE_WINDOW))
+
+    @api.model
+    def _mollie_webhook_stats(self):
+        """ Returns counters of received notifications and saved status fetches """
+        self.env.cr.execute("""
+            SELECT count(*) + coalesce(sum(coalesced_count), 0),
+                   coalesce(sum(coalesced_count), 0),
+                   count(*) FILTER (WHERE state = 'merged'),
+                   count(*) FILTER (WHERE state = 'skipped')
+              FROM mollie_webhook_queue
+        """)
+        received, coalesced, merged, skipped = self.env.cr.fetchone()
+        return {
+            'received': received,
+            'coalesced': coalesced,
+            'merged': merged,
+            'skipped': skipped,
+            'saved_calls': coalesced + merged + skipped,
+        }
+
+    @api.model
+    def _cron_process_webhook_queue(self, batch_size=WEBHOOK_BATCH_SIZE):
+        """ Process pending notifications batch by batch. Failed notifications
+            are rescheduled with backoff (upto `WEBHOOK_MAX_ATTEMPTS`), they
+            are never processed again in the same call.
+        """
+        now = fields.Datetime.now()
+        # Notifications younger than coalesce window are left for next call
+        max_create_date = now - timedelta(seconds=self._mollie_coalesce_window())
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM mollie_webhook_queue
+                 WHERE state = 'pending' AND create_date <= %s AND (next_attempt_at IS NULL OR next_attempt_at <= %s)
+                 ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (max_create_date, now, batch_size))
+            event_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not event_ids:
+                break
+            self.browse(event_ids)._mollie_process_events()
+            self.env.cr.commit()
+        return True
+
+    @api.model
+    def _cron_vacuum_webhook_queue(self):
+        """ Delete processed notifications older than the retention period.
+            Notifications in error are kept for investigation.
+        """
+        retention_days = int(self.env['ir.config_parameter'].sudo().get_param('payment_mollie_official.webhook_retention_days', WEBHOOK_RETENTION_DAYS))
+        limit_date = fields.Datetime.now() - timedelta(days=retention_days)
+        while True:
+            self.env.cr.execute("""
+                DELETE FROM mollie_webhook_queue
+                 WHERE id IN (SELECT id FROM mollie_webhook_queue
+                               WHERE state IN ('done', 'merged', 'skipped') AND create_date < %s
+                               LIMIT %s)
+            """, (limit_date, WEBHOOK_VACUUM_BATCH_SIZE))
+            deleted = self.env.cr.rowcount
+            self.env.cr.commit()
+            if deleted < WEBHOOK_VACUUM_BATCH_SIZE:
+                break
+        return True
+
+    @api.model
+    def _mollie_next_attempt_at(self, attempts):
+        delay = min(WEBHOOK_RETRY_DELAY * 2 ** (attempts - 1), WEBHOOK_MAX_RETRY_DELAY)
+        return fields.Datetime.now() + timedelta(seconds=delay)
+
+    def _mollie_process_events(self):
+        """ Notifications for the same mollie id are processed only once """
+        events_by_mollie_id = OrderedDict()
+        for event in self:
+            events_by_mollie_id.setdefault(event.mollie_id, self.browse())
+            events_by_mollie_id[event.mollie_id] |= event
+
+        for mollie_id, events in events_by_mollie_id.items():
+            try:
+                with self.env.cr.savepoint():
+                    fetched = events[-1]._mollie_get_record()._mollie_process_notification()
+                events[:-1].write({'state': 'merged', 'error_message': False, 'next_attempt_at': False})
+                events[-1].write({'state': 'done' if fetched else 'skipped', 'error_message': False, 'next_attempt_at': False})
+            except Exception as e:
+                _logger.exception("Mollie: can not process webhook for %s", mollie_id)
+                attempts = max(events.mapped('attempts')) + 1
+                events.write({
+                    'attempts': attempts,
+                    'error_message': str(e),
+                    'state': 'error' if attempts >= WEBHOOK_MAX_ATTEMPTS else 'pending',
+                    'next_attempt_at': self._mollie_next_attempt_at(attempts),
+                })
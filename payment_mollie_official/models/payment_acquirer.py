@@ -1,20 +1,71 @@
 # -*- coding: utf-8 -*-
 
 import base64
+import hashlib
 import logging
+import math
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from werkzeug import urls
-from mollie.api.client import Client as MollieClient
-from mollie.api.error import UnprocessableEntityError
+from mollie.api.error import ResponseError, UnprocessableEntityError
 
 from odoo import _, api, fields, models, service
 from odoo.exceptions import ValidationError
 from odoo.http import request
 
 from odoo.addons.payment_mollie_official.controllers.main import MollieController
+from odoo.addons.payment_mollie_official.tools import CircuitBreaker, MollieSessionClient, TTLCache
 
 _logger = logging.getLogger(__name__)
 
+# Availability of methods barely changes so we keep mollie response for
+# few minutes instead of calling methods API on every checkout render.
+METHODS_CACHE_TTL = 300
+METHODS_CACHE_SIZE = 512
+METHODS_AMOUNT_BUCKET = 10  # amount is rounded up to bucket of 10 in the cache key
+
+_methods_cache = TTLCache(maxsize=METHODS_CACHE_SIZE, ttl=METHODS_CACHE_TTL)
+
+# Eligibility table of the shop methods, keyed by the last change of the acquirer,
+# its methods and vouchers so other workers see the changes without clearing
+# the registry caches.
+_eligibility_cache = TTLCache(maxsize=METHODS_CACHE_SIZE, ttl=METHODS_CACHE_TTL)
+
+# HTTP sessions are kept per worker (keyed by database, API key and endpoint) so
+# keep-alive connections are reused between payment, order, refund and webhook calls.
+# Circuit breaker is kept with the session so checkout fails fast while mollie is down.
+CLIENT_TIMEOUT = 5
+CLIENT_POOL_SIZE = 10   # can be changed with `payment_mollie_official.http_pool_size` system parameter
+CLIENT_REGISTRY_TTL = 3600
+CLIENT_FAILURE_THRESHOLD = 5    # consecutive failures before checkout calls fail fast
+CLIENT_RESET_TIMEOUT = 30       # seconds before a trial call is let through again
+API_ENDPOINT_PARAM = 'payment_mollie_official.api_endpoint'     # local stand-in for benchmarks, empty means mollie
+
+
+def _close_client_data(key, client_data):
+    """ Release pooled connections of the dropped session """
+    client_data['session'].close()
+
+
+_client_registry = TTLCache(maxsize=32, ttl=CLIENT_REGISTRY_TTL, on_evict=_close_client_data)
+
+# Icons of new methods and issuers are downloaded concurrently while syncing methods.
+ICON_TIMEOUT = 10
+ICON_WORKERS = 8
+
+
+def _mollie_download_icon(image_url):
+    """ Runs in worker thread, must not use the ORM """
+    try:
+        response = requests.get(image_url, timeout=ICON_TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        _logger.warning('Mollie: unable to download icon %s: %s', image_url, e)
+        return False
+    return response.content
+
 
 class PaymentAcquirerMollie(models.Model):
     _inherit = 'payment.acquirer'
@@ -30,6 +81,12 @@ class PaymentAcquirerMollie(models.Model):
     mollie_use_components = fields.Boolean(string='Mollie Components', default=True)
     mollie_show_save_card = fields.Boolean(string='Single-Click payments')
 
+    def write(self, vals):
+        res = super().write(vals)
+        if any(field in vals for field in ['mollie_profile_id', 'mollie_methods_ids', 'mollie_voucher_ids']):
+            self._mollie_invalidate_methods_eligibility()
+        return res
+
     def _get_feature_support(self):
         res = super(PaymentAcquirerMollie, self)._get_feature_support()
         res['fees'].append('mollie')
@@ -74,11 +131,15 @@ class PaymentAcquirerMollie(models.Model):
                     acquirer.mollie_voucher_enabled = True
 
     def action_mollie_sync_methods(self):
+        self._mollie_invalidate_methods_cache()
         methods = self._api_mollie_get_active_payment_methods()
         if methods:
             self._sync_mollie_methods(methods)
             self._create_method_translations(methods)
 
+    def action_mollie_api_metrics(self):
+        return self.env['mollie.api.metrics'].action_open_metrics()
+
     def _create_method_translations(self, english_methods):
         IrTranslation = self.env['ir.translation']
         supported_locale = self._mollie_get_supported_locale()
@@ -132,10 +193,42 @@ class PaymentAcquirerMollie(models.Model):
 
         # Create New methods
         methods_to_create = methods_dict.keys() - set(existing_methods.mapped('method_id_code'))
-        MolliePaymentMethod = self.env['mollie.payment.method']
-        for method in methods_to_create:
-            data = methods_dict[method]
-
+        if not methods_to_create:
+            return
+        new_methods = [methods_dict[method] for method in methods_to_create]
+        new_issuers = {issuer_data['id']: issuer_data for data in new_methods for issuer_data in data.get('issuers') or []}
+
+        # Pre-resolve issuers and icons in bulk
+        MollieIssuer = self.env['mollie.payment.method.issuer']
+        issuers = {issuer.issuers_id_code: issuer for issuer in MollieIssuer.search([('issuers_id_code', 'in', list(new_issuers))])}
+        icon_names = {data['description'] for data in new_methods} | {new_issuers[code]['name'] for code in new_issuers.keys() - issuers.keys()}
+        icons = {}
+        for icon in self.env['payment.icon'].search([('name', 'in', list(icon_names))]):
+            icons.setdefault(icon.name, icon)
+
+        # Download the missing icons in parallel, once per url
+        icon_urls = {}
+        for code in new_issuers.keys() - issuers.keys():
+            issuer_data = new_issuers[code]
+            if issuer_data['name'] not in icons and issuer_data.get('image', {}).get('size2x'):
+                icon_urls.setdefault(issuer_data['name'], issuer_data['image']['size2x'])
+        for data in new_methods:
+            if data['description'] not in icons and data.get('image', {}).get('size2x'):
+                icon_urls.setdefault(data['description'], data['image']['size2x'])
+        self._mollie_create_icons(icon_urls, icons)
+
+        # Create issuers
+        issuer_codes_to_create = [code for code in new_issuers if code not in issuers]
+        if issuer_codes_to_create:
+            created_issuers = MollieIssuer.create([{
+                'name': new_issuers[code]['name'],
+                'issuers_id_code': code,
+                'payment_icon_ids': [(6, 0, icons[new_issuers[code]['name']].ids if new_issuers[code]['name'] in icons else [])],
+            } for code in issuer_codes_to_create])
+            issuers.update(zip(issuer_codes_to_create, created_issuers))
+
+        methods_create_vals = []
+        for data in new_methods:
             create_vals = {
                 'name': data['description'],
                 'method_id_code': data['id'],
@@ -145,83 +238,152 @@ class PaymentAcquirerMollie(models.Model):
                 'supports_order_api': data.get('support_order_api', False),
                 'supports_payment_api': data.get('support_payment_api', False)
             }
-
-            # Manage issuer for the method
             if data.get('issuers'):
-                issuer_ids = []
-                for issuer_data in data['issuers']:
-                    MollieIssuer = self.env['mollie.payment.method.issuer']
-                    issuer = MollieIssuer.search([('issuers_id_code', '=', issuer_data['id'])], limit=1)
-                    if not issuer:
-                        issuer_create_vals = {
-                            'name': issuer_data['name'],
-                            'issuers_id_code': issuer_data['id'],
-                        }
-                        icon = self.env['payment.icon'].search([('name', '=', issuer_data['name'])], limit=1)
-                        image_url = issuer_data.get('image', {}).get('size2x')
-                        if not icon and image_url:
-                            icon = self.env['payment.icon'].create({
-                                'name': issuer_data['name'],
-                                'image': base64.b64encode(requests.get(image_url).content)
-                            })
-                        issuer_create_vals['payment_icon_ids'] = [(6, 0, [icon.id])]
-                        issuer = MollieIssuer.create(issuer_create_vals)
-                    issuer_ids.append(issuer.id)
-                if issuer_ids:
-                    create_vals['payment_issuer_ids'] = [(6, 0, issuer_ids)]
-
-            # Manage icon for method
-            icon = self.env['payment.icon'].search([('name', '=', data['description'])], limit=1)
-            image_url = data.get('image', {}).get('size2x')
-            if not icon and image_url:
-                icon = self.env['payment.icon'].create({
-                    'name': data['description'],
-                    'image': base64.b64encode(requests.get(image_url).content)
-                })
-            if icon:
-                create_vals['payment_icon_ids'] = [(6, 0, [icon.id])]
+                create_vals['payment_issuer_ids'] = [(6, 0, [issuers[issuer_data['id']].id for issuer_data in data['issuers']])]
+            if data['description'] in icons:
+                create_vals['payment_icon_ids'] = [(6, 0, icons[data['description']].ids)]
+            methods_create_vals.append(create_vals)
+        self.env['mollie.payment.method'].create(methods_create_vals)
 
-            MolliePaymentMethod.create(create_vals)
+    def _mollie_create_icons(self, icon_urls, icons):
+        """ Download `icon_urls` ({name: url}) concurrently and create the icons.
+
+            Each url is downloaded once and icons with the same content share
+            the same `payment.icon` record. `icons` ({name: icon}) is updated in place.
+        """
+        urls_to_fetch = list(set(icon_urls.values()))
+        if not urls_to_fetch:
+            return icons
+        with ThreadPoolExecutor(max_workers=min(ICON_WORKERS, len(urls_to_fetch))) as executor:
+            contents = dict(zip(urls_to_fetch, executor.map(_mollie_download_icon, urls_to_fetch)))
+
+        names_by_hash = {}
+        icon_vals = []
+        for name, url in icon_urls.items():
+            content = contents[url]
+            if not content:
+                continue
+            content_hash = hashlib.sha1(content).hexdigest()
+            if content_hash not in names_by_hash:
+                names_by_hash[content_hash] = []
+                icon_vals.append({'name': name, 'image': base64.b64encode(content)})
+            names_by_hash[content_hash].append(name)
+        created_icons = self.env['payment.icon'].create(icon_vals)
+        for icon, names in zip(created_icons, names_by_hash.values()):
+            for name in names:
+                icons[name] = icon
+        return icons
 
     def mollie_get_active_methods(self, order=None):
         # TODO: [PGA] Check currency is supported. Hard coded filter can be applied based on https://docs.mollie.com/payments/multicurrency
-        methods = self.mollie_methods_ids.filtered(lambda m: m.active and m.active_on_shop)
-
-        if not self.sudo().mollie_profile_id:
-            methods = methods.filtered(lambda m: m.method_id_code != 'creditcard')
-
-        # Hide methods if order amount is higher then method limits
-        remove_voucher_method, extra_params = True, {}
+        amount, has_voucher_products, extra_params = None, False, {}
         if order and order._name == 'sale.order':
-            methods = methods.filtered(lambda m: order.amount_total >= m.min_amount and (order.amount_total <= m.max_amount or not m.max_amount))
-            remove_voucher_method = not any(map(lambda p: p._get_mollie_voucher_category(), order.mapped('order_line.product_id.product_tmpl_id')))
+            amount = order.amount_total
+            has_voucher_products = any(order.mapped('order_line.product_id.product_tmpl_id')._mollie_get_voucher_categories().values())
             extra_params['amount'] = {'value': "%.2f" % order.amount_total, 'currency': order.currency_id.name}
             if order.partner_invoice_id.country_id:
                 extra_params['billingCountry'] = order.partner_invoice_id.country_id.code
         if order and order._name == 'account.move':
-            methods = methods.filtered(lambda m: order.amount_residual >= m.min_amount and (order.amount_residual <= m.max_amount or not m.max_amount))
-            remove_voucher_method = not any(map(lambda p: p._get_mollie_voucher_category(), order.mapped('invoice_line_ids.product_id.product_tmpl_id')))
+            amount = order.amount_residual
+            has_voucher_products = any(order.mapped('invoice_line_ids.product_id.product_tmpl_id')._mollie_get_voucher_categories().values())
             extra_params['amount'] = {'value': "%.2f" % order.amount_residual, 'currency': order.currency_id.name}
             if order.partner_id.country_id:
                 extra_params['billingCountry'] = order.partner_id.country_id.code
-        if remove_voucher_method:
-            methods = methods.filtered(lambda m: m.method_id_code != 'voucher')
 
-        # Hide only order type methods from transection links
-        if request and request.httprequest.path == '/website_payment/pay':
-            methods = methods.filtered(lambda m: m.supports_payment_api == True)
-
-        # Hide based on country
+        country_code = False
         if request:
             country_code = request.session.geoip and request.session.geoip.get('country_code') or False
-            if country_code:
-                methods = methods.filtered(lambda m: not m.country_ids or country_code in m.country_ids.mapped('code'))
 
         # Hide methods if mollie does not supports them
-        suppported_methods = self.sudo()._api_mollie_get_active_payment_methods(extra_params=extra_params)   # sudo as public user do not have access
-        methods = methods.filtered(lambda m: m.method_id_code in suppported_methods.keys())
+        suppported_methods = self.sudo()._mollie_get_cached_active_methods(extra_params=extra_params)   # sudo as public user do not have access
+
+        method_ids = self._mollie_filter_eligible_methods(
+            amount=amount,
+            voucher=has_voucher_products,
+            payment_api_only=bool(request and request.httprequest.path == '/website_payment/pay'),  # Hide only order type methods from transection links
+            country_code=country_code,
+            supported_codes=suppported_methods.keys()
+        )
+        return self.env['mollie.payment.method'].browse(method_ids)
+
+    def _mollie_get_methods_eligibility(self):
+        """ Precomputed data of shop methods used to filter methods on checkout.
+            Cached entry is replaced when methods, vouchers or acquirer are modified.
+
+            :return: tuple (sorted min amounts, method rows sorted by min amount, method ids in display order)
+        """
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT (SELECT write_date FROM payment_acquirer WHERE id = %(id)s),
+                   (SELECT ROW(MAX(write_date), COUNT(*))::text FROM mollie_payment_method WHERE parent_id = %(id)s),
+                   (SELECT ROW(MAX(write_date), COUNT(*))::text FROM mollie_voucher_line WHERE acquirer_id = %(id)s)
+        """, {'id': self.id})
+        cache_key = (self.env.cr.dbname, self.id) + self.env.cr.fetchone()
+        return _eligibility_cache.get_or_set(cache_key, self._mollie_compute_methods_eligibility)
+
+    def _mollie_compute_methods_eligibility(self):
+        acquirer_sudo = self.sudo().with_context(active_test=False)    # result is cached, it must not depend on caller context
+        rows = []
+        for method in acquirer_sudo.mollie_methods_ids.filtered(lambda m: m.active and m.active_on_shop):
+            if method.method_id_code == 'creditcard' and not acquirer_sudo.mollie_profile_id:
+                continue
+            rows.append((
+                method.min_amount,
+                method.max_amount or float('inf'),
+                method.id,
+                method.method_id_code,
+                frozenset(method.country_ids.mapped('code')),
+                method.supports_payment_api,
+            ))
+        ordered_ids = tuple(row[2] for row in rows)
+        rows.sort(key=lambda row: row[0])
+        return tuple(row[0] for row in rows), tuple(rows), ordered_ids
+
+    def _mollie_filter_eligible_methods(self, amount=None, voucher=False, payment_api_only=False, country_code=False, supported_codes=None):
+        """ Returns ids of the methods available for given conditions (in display order) """
+        min_amounts, rows, ordered_ids = self._mollie_get_methods_eligibility()
+        if amount is not None:
+            rows = rows[:bisect_right(min_amounts, amount)]    # Hide methods if order amount is lower then method limits
+        eligible_ids = {
+            method_id for _min_amount, max_amount, method_id, code, countries, supports_payment_api in rows
+            if (amount is None or amount <= max_amount)
+            and (voucher or code != 'voucher')
+            and (supports_payment_api or not payment_api_only)
+            and (not countries or not country_code or country_code in countries)
+            and (supported_codes is None or code in supported_codes)
+        }
+        return [method_id for method_id in ordered_ids if method_id in eligible_ids]
 
-        return methods
+    def _mollie_get_cached_active_methods(self, extra_params={}):
+        """ Same as `_api_mollie_get_active_payment_methods` but response is kept in
+            process wide cache. Amount is rounded in buckets so near amounts share the
+            same entry, exact min/max amounts are still checked on the method records.
+        """
+        self.ensure_one()
+        amount = extra_params.get('amount') or {}
+        amount_bucket = False
+        if amount.get('value'):
+            amount_bucket = int(math.ceil(float(amount['value']) / METHODS_AMOUNT_BUCKET) * METHODS_AMOUNT_BUCKET)
+        cache_key = (
+            self.env.cr.dbname, self.id, self.state, amount.get('currency'), amount_bucket,
+            extra_params.get('billingCountry'), self._mollie_user_locale()
+        )
+        return _methods_cache.get_or_set(cache_key, lambda: self._api_mollie_get_active_payment_methods(extra_params=extra_params))
+
+    def _mollie_invalidate_methods_eligibility(self):
+        """ Drop outdated eligibility entries of this worker, other workers miss the cache as its key changed """
+        dbname = self.env.cr.dbname
+        acquirer_ids = set(self.ids)
+        _eligibility_cache.invalidate(lambda key: key[0] == dbname and key[1] in acquirer_ids)
+
+    def _mollie_invalidate_methods_cache(self):
+        dbname = self.env.cr.dbname
+        acquirer_ids = set(self.ids)
+        _methods_cache.invalidate(lambda key: key[0] == dbname and key[1] in acquirer_ids)
+
+    @api.model
+    def _mollie_methods_cache_stats(self):
+        return _methods_cache.stats()
 
     def mollie_form_generate_values(self, tx_values):
         self.ensure_one()
@@ -418,24 +580,52 @@ class PaymentAcquirerMollie(models.Model):
     # -----------------------------------------------
 
     def _api_mollie_get_client(self):
-        mollie_client = MollieClient(timeout=5)
-        # TODO: [PGA] Add partical validation for keys e.g. production key should start from live_
+        """ Return mollie client using the pooled session of the API key.
 
+            Client object itself is cheap and not thread safe (resources like
+            `payment_refunds.on()` keep state) so we only share the session and
+            the user agent components between calls.
+        """
+        # TODO: [PGA] Add partical validation for keys e.g. production key should start from live_
+        api_key = False
         if self.state == 'enabled':
-            mollie_client.set_api_key(self.mollie_api_key_prod)
+            api_key = self.mollie_api_key_prod
         elif self.state == 'test':
-            mollie_client.set_api_key(self.mollie_api_key_test)
+            api_key = self.mollie_api_key_test
+
+        api_endpoint = self.env['ir.config_parameter'].sudo().get_param(API_ENDPOINT_PARAM) or None
+        client_data = _client_registry.get_or_set((self.env.cr.dbname, api_key, api_endpoint), self._api_mollie_prepare_client_data)
 
-        mollie_client.set_user_agent_component('Odoo', service.common.exp_version()['server_version'])
-        mollie_client.set_user_agent_component('MollieOdoo', self.env.ref('base.module_payment_mollie_official').installed_version)
+        mollie_client = MollieSessionClient(client_data['session'], api_endpoint=api_endpoint, timeout=CLIENT_TIMEOUT, breaker=client_data['breaker'])
+        if api_key:
+            mollie_client.set_api_key(api_key)
+        for name, version in client_data['user_agent']:
+            mollie_client.set_user_agent_component(name, version)
         return mollie_client
 
+    def _api_mollie_prepare_client_data(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        pool_size = int(ICP.get_param('payment_mollie_official.http_pool_size', CLIENT_POOL_SIZE))
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        return {
+            'session': session,
+            'breaker': CircuitBreaker(CLIENT_FAILURE_THRESHOLD, CLIENT_RESET_TIMEOUT),
+            'user_agent': [
+                ('Odoo', service.common.exp_version()['server_version']),
+                ('MollieOdoo', self.env.ref('base.module_payment_mollie_official').installed_version),
+            ]
+        }
+
     def _api_mollie_create_payment(self, payment_data, params={}):
         mollie_client = self._api_mollie_get_client()
         try:
             result = mollie_client.payments.create(payment_data, **params)
         except UnprocessableEntityError as e:
             return {'error': str(e)}
+        except ResponseError as e:
+            self._mollie_check_customer_error(e, payment_data)
+            raise
         return result
 
     def _api_mollie_create_order(self, payment_data):
@@ -444,8 +634,16 @@ class PaymentAcquirerMollie(models.Model):
             result = mollie_client.orders.create(payment_data)
         except UnprocessableEntityError as e:
             return {'error': str(e)}
+        except ResponseError as e:
+            self._mollie_check_customer_error(e, payment_data.get('payment', {}))
+            raise
         return result
 
+    def _mollie_check_customer_error(self, error, payment_data):
+        """ Customer is deleted on mollie side, validate it again on next checkout """
+        if getattr(error, 'status', None) == 410 and payment_data.get('customerId'):
+            self.env.user._mollie_reset_customer_validation()
+
     def _api_mollie_get_payment(self, tx_id):
         mollie_client = self._api_mollie_get_client()
         return mollie_client.payments.get(tx_id)
@@ -542,31 +740,37 @@ class PaymentAcquirerMollie(models.Model):
 
     def _mollie_prepare_so_lines(self, lines, transaction):
         result = []
+        lines_common_data = self._mollie_prepare_lines_common_batch(lines)
+        lines.mapped('tax_id.amount')   # prefetch taxes of all the lines
+        voucher_categories = {}
+        if transaction.mollie_payment_method == 'voucher':
+            voucher_categories = lines.mapped('product_template_id')._mollie_get_voucher_categories()
+
         for line in lines:
-            line_data = self._mollie_prepare_lines_common(line)
+            currency = line.currency_id.name
+            line_data = lines_common_data[line.id]
             line_data.update({
                 'quantity': int(line.product_uom_qty),    # TODO: Mollie does not support float. Test with float amount
                 'unitPrice': {
-                    'currency': line.currency_id.name,
+                    'currency': currency,
                     'value': "%.2f" % line.price_reduce_taxinc
                 },
                 'totalAmount': {
-                    'currency': line.currency_id.name,
+                    'currency': currency,
                     'value': "%.2f" % line.price_total,
                 },
                 'vatRate': "%.2f" % sum(line.tax_id.mapped('amount')),
                 'vatAmount': {
-                    'currency': line.currency_id.name,
+                    'currency': currency,
                     'value': "%.2f" % line.price_tax,
                 }
             })
 
-            if transaction.mollie_payment_method == 'voucher':
-                category = line.product_template_id._get_mollie_voucher_category()
-                if category:
-                    line_data.update({
-                        'category': category
-                    })
+            category = voucher_categories.get(line.product_template_id.id)
+            if category:
+                line_data.update({
+                    'category': category
+                })
 
             result.append(line_data)
         return result
@@ -587,59 +791,81 @@ class PaymentAcquirerMollie(models.Model):
                 vatAmount = total_price_tax_included - total_price_tax_excluded
         """
         result = []
+        lines_common_data = self._mollie_prepare_lines_common_batch(lines)
+        lines.mapped('tax_ids.amount')   # prefetch taxes of all the lines
+        voucher_categories = {}
+        if transaction.mollie_payment_method == 'voucher':
+            voucher_categories = lines.mapped('product_id.product_tmpl_id')._mollie_get_voucher_categories()
+
         for line in lines:
-            line_data = self._mollie_prepare_lines_common(line)
+            currency = line.currency_id.name
+            line_data = lines_common_data[line.id]
             line_data.update({
                 'quantity': int(line.quantity),    # TODO: Mollie does not support float. Test with float amount
                 'unitPrice': {
-                    'currency': line.currency_id.name,
+                    'currency': currency,
                     'value': "%.2f" % (line.price_total / int(line.quantity))
                 },
                 'totalAmount': {
-                    'currency': line.currency_id.name,
+                    'currency': currency,
                     'value': "%.2f" % line.price_total,
                 },
                 'vatRate': "%.2f" % sum(line.tax_ids.mapped('amount')),
                 'vatAmount': {
-                    'currency': line.currency_id.name,
+                    'currency': currency,
                     'value': "%.2f" % (line.price_total - line.price_subtotal),
                 }
             })
 
-            if transaction.mollie_payment_method == 'voucher':
-                category = line.product_id.product_tmpl_id._get_mollie_voucher_category()
-                if category:
-                    line_data.update({
-                        'category': category
-                    })
+            category = voucher_categories.get(line.product_id.product_tmpl_id.id)
+            if category:
+                line_data.update({
+                    'category': category
+                })
             result.append(line_data)
 
         return result
 
     def _mollie_prepare_lines_common(self, line):
+        return self._mollie_prepare_lines_common_batch(line)[line.id]
 
-        product_data = {
-            'name': line.name,
-            "type": "physical",
-        }
+    def _mollie_prepare_lines_common_batch(self, lines):
+        """ Common line data for all the lines in one pass. Base url is computed
+            once and product urls are computed for all the products together.
 
-        if line.product_id.type == 'service':
-            product_data['type'] = 'digital'  # We are considering service product as digital as we don't do shipping for it.
+            :return: dict of line id -> line data
+        """
+        has_delivery_field = 'is_delivery' in lines._fields
+        products = lines.mapped('product_id')
+        product_urls = {}
+        if products and 'website_url' in products._fields:
+            base_url = self.get_base_url()
+            product_urls = {product.id: urls.url_join(base_url, product.website_url) for product in products}
 
-        if 'is_delivery' in line._fields and line.is_delivery:
-            product_data['type'] = 'shipping_fee'
+        result = {}
+        for line in lines:
+            product_data = {
+                'name': line.name,
+                "type": "physical",
+            }
 
-        if line.product_id and 'website_url' in line.product_id._fields:
-            base_url = self.get_base_url()
-            product_data['productUrl'] = urls.url_join(base_url, line.product_id.website_url)
+            if line.product_id.type == 'service':
+                product_data['type'] = 'digital'  # We are considering service product as digital as we don't do shipping for it.
 
-        # Metadata - used to sync delivery data with shipment API
-        product_data['metadata'] = {
-            'line_id': line.id,
-            'product_id': line.product_id.id
-        }
+            if has_delivery_field and line.is_delivery:
+                product_data['type'] = 'shipping_fee'
+
+            if line.product_id.id in product_urls:
+                product_data['productUrl'] = product_urls[line.product_id.id]
 
-        return product_data
+            # Metadata - used to sync delivery data with shipment API
+            product_data['metadata'] = {
+                'line_id': line.id,
+                'product_id': line.product_id.id
+            }
+            result[line.id] = product_data
+
+        return result
 
     # -----------------------------------------------
     # Helper methods for mollie
@@ -7,12 +7,14 @@ import dateutil.parser
 from odoo import http, tools
 from odoo.http import request
 from odoo.exceptions import ValidationError
-from odoo.tools import float_is_zero, float_compare
+from odoo.tools import float_is_zero, float_compare, split_every
 
 from odoo import _, api, fields, models
 
 _logger = logging.getLogger(__name__)
 
+MOLLIE_IDS_BATCH_SIZE = 1000
+
 
 class PaymentTransaction(models.Model):
     _inherit = 'payment.transaction'
@@ -23,6 +25,28 @@ class PaymentTransaction(models.Model):
     mollie_reminder_payment_id = fields.Many2one('account.payment', string='Reminder Payment', readonly=True)
     mollie_save_card = fields.Boolean()
 
+    def init(self):
+        super().init()
+        # Webhooks, settlement sync and shipment sync search transactions by mollie id (`tr_`/`ord_`)
+        # Partial index is enough as mollie references are never searched with NULL value. It covers
+        # the references of all acquirers, provider can not be used in the index predicate.
+        self.env.cr.execute("""
+            DROP INDEX IF EXISTS payment_transaction_mollie_acquirer_reference_index;
+            CREATE INDEX IF NOT EXISTS payment_transaction_acquirer_reference_index
+                ON payment_transaction (acquirer_reference, acquirer_id)
+             WHERE acquirer_reference IS NOT NULL
+        """)
+
+    @api.model
+    def _mollie_get_by_mollie_ids(self, mollie_ids):
+        """ Returns mollie transactions for given mollie payment/order ids.
+            Ids are searched by chunks so it can be used with long lists.
+        """
+        transaction_ids = []
+        for mollie_ids_chunk in split_every(MOLLIE_IDS_BATCH_SIZE, set(filter(None, mollie_ids)), list):
+            transaction_ids += self.search([('acquirer_reference', 'in', mollie_ids_chunk), ('acquirer_id.provider', '=', 'mollie')]).ids
+        return self.browse(transaction_ids)
+
     def mollie_create(self, vals):
         create_vals = {}
 
@@ -46,7 +70,7 @@ class PaymentTransaction(models.Model):
 
     def _mollie_form_get_tx_from_data(self, data):
         acquirer_reference = data.get("id")
-        transaction = self.search([("acquirer_reference", "=", acquirer_reference)])
+        transaction = self._mollie_get_by_mollie_ids([acquirer_reference])
         if len(transaction) != 1:
             error_msg = _("Mollie:received response for reference %s") % (transaction.reference)
             if not transaction:
@@ -166,11 +190,28 @@ class PaymentTransaction(models.Model):
             will be called from transection form view.
         """
         self.ensure_one()
+        self._mollie_process_notification()
+
+    def _mollie_process_notification(self):
+        """ Fetch latest payment data from mollie and update the transaction.
+            This is called from webhook queue and manual validation.
+
+            :return: False if fetch was not needed because transaction is already in final state
+        """
+        self.ensure_one()
+        fetched = False
         if self.state not in ['done', 'cancel']:
             data = self.acquirer_id._mollie_get_payment_data(self.acquirer_reference)
             self.form_feedback(data, "mollie")
+            fetched = True
+
+        # We will process the payment from webhook confirmation. payment confirmation might
+        # be delayed and user might left the screen (may be user paid via QR and left the screen).
+        # A cron is already there for such confirmation but we will process the order immediately
+        # because we already got the confirmation and there is no need to wait for cron.
         if self.state == 'done' and not self.is_processed:
             self._post_process_after_done()
+        return fetched
 
     def _get_transaction_customer_id(self):
         """ This method return mollie customer id if needed in transection
@@ -183,6 +224,9 @@ class PaymentTransaction(models.Model):
             if not mollie_customer_id:
                 customer_id_data = self.acquirer_id._api_mollie_create_customer_id()
                 if customer_id_data and customer_id_data.get('id'):
-                    user_sudo.mollie_customer_id = customer_id_data.get('id')
+                    user_sudo.write({
+                        'mollie_customer_id': customer_id_data.get('id'),
+                        'mollie_customer_validated_at': fields.Datetime.now(),
+                    })
                     mollie_customer_id = user_sudo.mollie_customer_id
         return mollie_customer_id
@@ -14,18 +14,33 @@ class ProductTemplate(models.Model):
 
     def _get_mollie_voucher_category(self):
         self.ensure_one()
-        if self.mollie_voucher_category:
-            return self.mollie_voucher_category
-        mollie_voucher_category = False
-        category_id = self.categ_id
-        if category_id:
-            while not mollie_voucher_category and category_id:
-                mollie_voucher_category = category_id.mollie_voucher_category
-                category_id = category_id.parent_id
-        return mollie_voucher_category
+        return self.mollie_voucher_category or self.categ_id.mollie_voucher_effective_category
+
+    def _mollie_get_voucher_categories(self):
+        """ Batched version of `_get_mollie_voucher_category`.
+
+            :return: dict of template id -> voucher category (or False)
+        """
+        # reading effective category on whole recordset loads categories in one query
+        self.mapped('categ_id.mollie_voucher_effective_category')
+        return {template.id: template.mollie_voucher_category or template.categ_id.mollie_voucher_effective_category for template in self}
 
 
 class ProductCategory(models.Model):
     _inherit = 'product.category'
 
     mollie_voucher_category = fields.Selection([('meal', 'Meal'), ('eco', 'Eco'), ('gift', 'Gift')])
+    mollie_voucher_effective_category = fields.Selection(
+        [('meal', 'Meal'), ('eco', 'Eco'), ('gift', 'Gift')], compute='_compute_mollie_voucher_effective_category',
+        help="Voucher category of the category or of its nearest parent")
+
+    def _compute_mollie_voucher_effective_category(self):
+        """ Parents are read from `parent_path`, all the ancestors of the
+            categories are loaded with one query whatever the depth of the tree.
+        """
+        paths = {category: [int(parent_id) for parent_id in (category.parent_path or '').split('/') if parent_id] for category in self}
+        ancestor_ids = {parent_id for path in paths.values() for parent_id in path}
+        voucher_categories = {ancestor.id: ancestor.mollie_voucher_category for ancestor in self.browse(ancestor_ids)}
+        for category, path in paths.items():
+            category.mollie_voucher_effective_category = category.mollie_voucher_category or next(
+                (voucher_categories[parent_id] for parent_id in reversed(path) if voucher_categories.get(parent_id)), False)
@@ -1,18 +1,54 @@
-
 # -*- coding: utf-8 -*-
 
+from datetime import timedelta
+
 from odoo import _, api, fields, models
 
+from odoo.addons.payment_mollie_official.tools import TTLCache
+
+CUSTOMER_VALIDATION_TTL = 24 * 60 * 60   # re-check mollie customer once a day
+
+_validated_customers = TTLCache(maxsize=4096, ttl=CUSTOMER_VALIDATION_TTL)
+
 
 class ResUsers(models.Model):
     _inherit = 'res.users'
 
     mollie_customer_id = fields.Char()
+    mollie_customer_validated_at = fields.Datetime(copy=False)
 
     def _mollie_validate_customer_id(self, acquirer):
+        """ Check customer still exists on mollie. Result is kept in the worker cache
+            and in `mollie_customer_validated_at` so checkout pages do not call the
+            API on every render.
+        """
         self.ensure_one()
-        customer_id = self.sudo().mollie_customer_id
-        if customer_id:
-            customer_data = acquirer._api_get_customer_data(customer_id)
-            if customer_data.get('status') == 410:    # customer ID deleted
-                self.mollie_customer_id = False
+        user_sudo = self.sudo()
+        customer_id = user_sudo.mollie_customer_id
+        if not customer_id:
+            return
+
+        cache_key = (self.env.cr.dbname, self.id, customer_id)
+        if _validated_customers.get(cache_key):
+            return
+
+        validated_at = user_sudo.mollie_customer_validated_at
+        if validated_at:
+            remaining_ttl = (validated_at + timedelta(seconds=CUSTOMER_VALIDATION_TTL) - fields.Datetime.now()).total_seconds()
+            if remaining_ttl > 0:
+                _validated_customers.set(cache_key, True, ttl=remaining_ttl)
+                return
+
+        customer_data = acquirer._api_get_customer_data(customer_id)
+        if customer_data.get('status') == 410:    # customer ID deleted
+            user_sudo.write({'mollie_customer_id': False, 'mollie_customer_validated_at': False})
+        else:
+            user_sudo.mollie_customer_validated_at = fields.Datetime.now()
+            _validated_customers.set(cache_key, True)
+
+    def _mollie_reset_customer_validation(self):
+        """ Force validation of mollie customer on next check (e.g. payment failed with 410) """
+        dbname = self.env.cr.dbname
+        user_ids = set(self.ids)
+        _validated_customers.invalidate(lambda key: key[0] == dbname and key[1] in user_ids)
+        self.sudo().write({'mollie_customer_validated_at': False})
@@ -2,7 +2,7 @@
 
 import logging
 
-from odoo import fields, models
+from odoo import api, fields, models
 
 _logger = logging.getLogger(__name__)
 
@@ -22,7 +22,22 @@ class MollieVoucherLines(models.Model):
     mollie_voucher_category = fields.Selection(related="category_id.mollie_voucher_category", readonly=False)
     acquirer_id = fields.Many2one('payment.acquirer')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        voucher_lines = super().create(vals_list)
+        voucher_lines.acquirer_id._mollie_invalidate_methods_eligibility()
+        return voucher_lines
+
+    def write(self, vals):
+        acquirers = self.acquirer_id
+        res = super().write(vals)
+        (acquirers | self.acquirer_id)._mollie_invalidate_methods_eligibility()
+        return res
+
     def unlink(self):
+        acquirers = self.acquirer_id
         for voucher_line in self:
             voucher_line.mollie_voucher_category = False
-        return super().unlink()
+        res = super().unlink()
+        acquirers._mollie_invalidate_methods_eligibility()
+        return res
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import requests
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.payment_mollie_official.tools import CircuitBreaker, CircuitOpenError, FakeMollieServer, RequestExecutor, TTLCache
+
+
+class TestTTLCache(BaseCase):
+
+    def test_get_set(self):
+        cache = TTLCache()
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_expiry(self):
+        evicted = []
+        cache = TTLCache(on_evict=lambda key, value: evicted.append(key))
+        cache.set('old', 'value', ttl=-1)
+        self.assertEqual(cache.get('old', 'missing'), 'missing')
+        self.assertEqual(evicted, ['old'])
+
+        # expired values never requested again are released on next set
+        cache.set('old', 'value', ttl=-1)
+        cache.set('new', 'value')
+        self.assertEqual(evicted, ['old', 'old'])
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_lru_eviction(self):
+        evicted = []
+        cache = TTLCache(maxsize=2, on_evict=lambda key, value: evicted.append((key, value)))
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(evicted, [('b', 2)])
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_on_evict_replace_invalidate(self):
+        evicted = []
+        cache = TTLCache(on_evict=lambda key, value: evicted.append((key, value)))
+        value = object()
+        cache.set('a', value)
+        cache.set('a', value)
+        self.assertEqual(evicted, [], "Value stored again must not be released")
+        cache.set('a', 'other')
+        self.assertEqual(evicted, [('a', value)])
+        cache.set(('db', 1), 'x')
+        cache.set(('db', 2), 'y')
+        cache.invalidate(lambda key: key == ('db', 1))
+        self.assertEqual(evicted[1:], [(('db', 1), 'x')])
+        cache.invalidate()
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual(len(evicted), 4)
+
+    def test_get_or_set(self):
+        calls = []
+        cache = TTLCache()
+        for dummy in range(3):
+            self.assertEqual(cache.get_or_set('key', lambda: calls.append(1) or 'value'), 'value')
+        self.assertEqual(len(calls), 1)
+
+
+class TestCircuitBreaker(BaseCase):
+
+    def test_open_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+    def test_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow(), "One trial call is let through after the reset timeout")
+        self.assertFalse(breaker.allow(), "Only one trial call at a time")
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow(), "Circuit is closed after successful trial")
+
+
+class TestRequestExecutor(BaseCase):
+
+    def _executor(self, **kwargs):
+        # no backoff and no rate limit so the retries do not slow down the tests
+        kwargs.setdefault('backoff', 0)
+        return RequestExecutor(rate=1000, **kwargs)
+
+    def _statuses(self, *statuses, headers=None):
+        """ Responder returning `statuses` one after the other, the last one is repeated """
+        statuses = list(statuses)
+
+        def respond(method, path, query, body):
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            return status, {'status': status}, headers or {}
+        return respond
+
+    def _response(self, headers):
+        response = requests.Response()
+        response.headers.update(headers)
+        return response
+
+    def test_parse_retry_after(self):
+        executor = self._executor(max_backoff=30)
+        self.assertEqual(executor._parse_retry_after(self._response({'Retry-After': '3'})), 3)
+        self.assertEqual(executor._parse_retry_after(self._response({'Retry-After': '-3'})), 0)
+        self.assertEqual(executor._parse_retry_after(self._response({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})), 0)
+        self.assertIsNone(executor._parse_retry_after(self._response({'Retry-After': 'soon'})))
+        self.assertIsNone(executor._parse_retry_after(self._response({})))
+        self.assertEqual(executor._get_delay(0, 3), 3)
+        self.assertEqual(executor._get_delay(0, 120), 30, "Retry-After is capped to max backoff")
+
+    def test_retry_after(self):
+        with FakeMollieServer({('GET', '/v2/methods'): self._statuses(429, 200, headers={'Retry-After': '0'})}) as server:
+            response = self._executor().request('GET', server.url + '/v2/methods')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.calls[('GET', '/v2/methods')], 2)
+
+    def test_get_retried(self):
+        with FakeMollieServer({('GET', '/v2/methods'): self._statuses(503)}) as server:
+            with self.assertRaises(requests.exceptions.HTTPError) as error:
+                self._executor(max_retries=2, failure_threshold=10).request('GET', server.url + '/v2/methods')
+        self.assertEqual(error.exception.response.status_code, 503)
+        self.assertEqual(error.exception.attempt, 2)
+        self.assertEqual(server.calls[('GET', '/v2/methods')], 3)
+
+    def test_post_not_retried(self):
+        with FakeMollieServer({('POST', '/v2/payments'): self._statuses(503)}) as server:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self._executor().request('POST', server.url + '/v2/payments', json={})
+        self.assertEqual(server.calls[('POST', '/v2/payments')], 1, "Payment may have been created, it must not be posted again")
+
+    def test_post_retried_on_429(self):
+        with FakeMollieServer({('POST', '/v2/payments'): self._statuses(429, 201, headers={'Retry-After': '0'})}) as server:
+            response = self._executor().request('POST', server.url + '/v2/payments', json={})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(server.calls[('POST', '/v2/payments')], 2)
+
+    def test_client_error_not_retried(self):
+        with FakeMollieServer({}) as server:
+            with self.assertRaises(requests.exceptions.HTTPError) as error:
+                self._executor().request('GET', server.url + '/v2/payments/tr_unknown')
+        self.assertEqual(error.exception.response.status_code, 404)
+        self.assertEqual(sum(server.calls.values()), 1)
+
+    def test_circuit_open(self):
+        executor = self._executor(max_retries=0, failure_threshold=1)
+        with FakeMollieServer({('GET', '/v2/methods'): self._statuses(503)}) as server:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                executor.request('GET', server.url + '/v2/methods')
+            with self.assertRaises(CircuitOpenError):
+                executor.request('GET', server.url + '/v2/methods')
+        self.assertEqual(server.calls[('GET', '/v2/methods')], 1, "API is not called while the circuit is open")
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+from .cache import TTLCache
+from .benchmark import FakeMollieServer, run_benchmark
+from .metrics import api_metrics
+from .mollie_client import MollieSessionClient
+from .request_executor import CircuitBreaker, CircuitOpenError, RequestExecutor
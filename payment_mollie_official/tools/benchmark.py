@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit
+
+from .metrics import normalize_endpoint
+
+
+class FakeMollieServer(object):
+    """ Local stand-in of the mollie API that replays recorded JSON responses.
+
+        `responses` maps `(method, path)` to the JSON body to return, ids in the
+        path can be replaced by `:id` to match all of them (e.g. `/v2/orders/:id`).
+        A callable receiving `(method, path, query, body)` can be used to build
+        dynamic responses (e.g. paginated settlements). Return `(status, body, headers)`
+        tuple to simulate errors like 429 with `Retry-After`. Point the addons
+        to `server.url` with the `*.api_endpoint` system parameters. Meant for
+        local benchmarks only, never start it on production servers.
+    """
+
+    def __init__(self, responses, latency=0.0, host='127.0.0.1', port=0):
+        self.responses = responses
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._httpd = HTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def _respond(self, method, path, query, body):
+        with self._lock:
+            self.calls[(method, path)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        response = self.responses.get((method, path))
+        if response is None:
+            response = self.responses.get((method, normalize_endpoint(path)))
+        if callable(response):
+            response = response(method, path, query, body)
+        if response is None:
+            return 404, {'status': 404, 'title': 'Not Found', 'detail': 'No recorded response for %s %s' % (method, path)}, {}
+        if isinstance(response, tuple):
+            return response
+        return 200, response, {}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _handle(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null')
+                status, payload, headers = server._respond(self.command, parts.path, parts.query, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/hal+json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def percentile(samples, pct):
+    """ Nearest rank percentile of non empty `samples` """
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def run_benchmark(func, iterations=100, cr=None, server=None, setup=None):
+    """ Call `func` `iterations` times and return latency percentiles (ms).
+
+        With `cr` the number of SQL queries per call is reported and with
+        `server` (a `FakeMollieServer`) the number of outbound API calls.
+        `setup` is called before each call, it is not measured.
+    """
+    durations = []
+    queries = 0
+    api_calls = 0
+    for dummy in range(iterations):
+        if setup:
+            setup()
+        if server:
+            server.reset_calls()
+        query_count = cr.sql_log_count if cr else 0
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+        if cr:
+            queries += cr.sql_log_count - query_count
+        if server:
+            api_calls += sum(server.calls.values())
+    return {
+        'iterations': iterations,
+        'p50': percentile(durations, 50),
+        'p95': percentile(durations, 95),
+        'p99': percentile(durations, 99),
+        'max': max(durations),
+        'queries_per_call': queries / iterations if cr else None,
+        'api_calls_per_call': api_calls / iterations if server else None,
+    }
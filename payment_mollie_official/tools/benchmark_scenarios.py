@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from odoo import http
+
+from ..controllers.main import MollieController
+from .benchmark import FakeMollieServer, run_benchmark
+
+# Scenarios are meant to be run from `odoo shell` on a copy of the database.
+# They create records (transactions, statements...) and never commit, crons run
+# with `no_commit`. Discard the records with `env.cr.rollback()` when done.
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'benchmark_fixtures')
+
+ENDPOINT_PARAMS = [
+    'payment_mollie_official.api_endpoint',
+    'mollie_account_sync.api_endpoint',
+    'mollie_pos_terminal.api_endpoint',
+]
+
+SETTLEMENT_SIZES = (1000, 10000, 100000)
+REFUND_RATIO = 20       # one refund every 20 payments in the settlements
+
+
+@lru_cache(maxsize=None)
+def _load_fixture(filename):
+    with open(os.path.join(FIXTURES_DIR, filename)) as fixture_file:
+        return json.load(fixture_file)
+
+
+def fixture(filename, **values):
+    """ Copy of recorded mollie response `filename` (e.g. `order.json`) updated with `values` """
+    data = copy.deepcopy(_load_fixture(filename))
+    data.update(values)
+    return data
+
+
+def _path_id(path):
+    """ `/v2/settlements/stl_jDk30akdN/payments` => `stl_jDk30akdN` """
+    return path.split('/')[3]
+
+
+def _new_id(prefix):
+    return '%s_bench%s' % (prefix, uuid.uuid4().hex[:10])
+
+
+@contextmanager
+def mollie_stand_in(env, responses, latency=0.0):
+    """ Start `FakeMollieServer` with `responses` and point all the mollie addons to it.
+
+        Endpoint parameters are restored on exit. Payment API clients are cached
+        per endpoint so the clients of the real API are never used for the stand-in.
+    """
+    with FakeMollieServer(responses, latency=latency) as server, system_params(env, {param: server.url for param in ENDPOINT_PARAMS}):
+        yield server
+
+
+@contextmanager
+def system_params(env, values):
+    """ Set the system parameters `values` for the duration of the run """
+    ICP = env['ir.config_parameter'].sudo()
+    previous = {param: ICP.get_param(param) for param in values}
+    for param, value in values.items():
+        ICP.set_param(param, value)
+    try:
+        yield
+    finally:
+        for param, value in previous.items():
+            ICP.set_param(param, value or False)
+
+
+@contextmanager
+def no_commit(cr):
+    """ Crons commit after each batch, their commits are ignored so the records
+        of the scenario can still be rolled back.
+    """
+    cr.commit = lambda: None
+    try:
+        yield
+    finally:
+        del cr.commit
+
+
+@contextmanager
+def http_client(env):
+    """ Werkzeug client of the odoo WSGI application, requests are handled in
+        test mode with the cursor of `env` so they see the records of the scenario.
+    """
+    session = http.root.session_store.new()
+    session.db = env.cr.dbname
+    http.root.session_store.save(session)
+    client = Client(http.root, BaseResponse)
+    client.set_cookie('localhost', 'session_id', session.sid)
+    env.registry.enter_test_mode(env.cr)
+    try:
+        yield client
+    finally:
+        env.registry.leave_test_mode()
+        http.root.session_store.delete(session)
+
+
+def paginated(base_url, resource, count, make_item, page_size=250):
+    """ Responder of list endpoint returning `count` items built with `make_item(index, path)`.
+
+        `count` can be a callable receiving the path. Pages are linked with
+        `_links.next` like mollie API, `from` is the index of the first item.
+    """
+    def respond(method, path, query, body):
+        params = parse_qs(query)
+        start = int(params.get('from', [0])[0])
+        limit = min(int(params.get('limit', [page_size])[0]), page_size)
+        total = count(path) if callable(count) else count
+        items = [make_item(index, path) for index in range(start, min(start + limit, total))]
+        next_link = None
+        if start + limit < total:
+            next_link = {'href': '%s%s?from=%s&limit=%s' % (base_url, path, start + limit, limit), 'type': 'application/hal+json'}
+        return {
+            'count': len(items),
+            '_embedded': {resource: items},
+            '_links': {
+                'self': {'href': '%s%s?%s' % (base_url, path, query), 'type': 'application/hal+json'},
+                'previous': None,
+                'next': next_link,
+            },
+        }
+    return respond
+
+
+class MollieOrdersStandIn(object):
+    """ Stateful responders of orders and payments API, orders created (or added
+        with `add`) can be fetched and shipped. Orders and their payment get `status`.
+    """
+
+    def __init__(self, status='created'):
+        self.status = status
+        self.orders = {}
+
+    def add(self, order_id, amount, currency, lines=None):
+        order = fixture('order.json', id=order_id, status=self.status, lines=lines or [])
+        order['amount'] = {'value': '%.2f' % float(amount), 'currency': currency}
+        payment = order['_embedded']['payments'][0]
+        payment.update(orderId=order_id, amount=order['amount'], status='open' if self.status == 'created' else self.status)
+        self.orders[order_id] = order
+        return order
+
+    def responses(self):
+        return {
+            ('POST', '/v2/orders'): self.create_order,
+            ('GET', '/v2/orders/:id'): self.get_order,
+            ('POST', '/v2/orders/:id/shipments'): self.create_shipment,
+            ('POST', '/v2/payments'): self.create_payment,
+        }
+
+    def create_order(self, method, path, query, body):
+        order_id = _new_id('ord')
+        lines = [
+            fixture('order_line.json', id='odl_%s' % index, orderId=order_id, name=line['name'], metadata=line.get('metadata'),
+                    quantity=line['quantity'], unitPrice=line['unitPrice'], totalAmount=line['totalAmount'])
+            for index, line in enumerate(body['lines'])
+        ]
+        return 201, self.add(order_id, body['amount']['value'], body['amount']['currency'], lines), {}
+
+    def get_order(self, method, path, query, body):
+        order = self.orders.get(_path_id(path))
+        if not order:
+            return 404, {'status': 404, 'title': 'Not Found', 'detail': 'No order exists with token %s.' % _path_id(path)}, {}
+        return order
+
+    def create_shipment(self, method, path, query, body):
+        return 201, fixture('shipment.json', id=_new_id('shp'), orderId=_path_id(path), lines=body.get('lines', [])), {}
+
+    def create_payment(self, method, path, query, body):
+        return 201, fixture('payment.json', id=_new_id('tr'), amount=body['amount'], status='open', metadata=body.get('metadata')), {}
+
+
+def bench_transaction(env, order, method='ideal'):
+    """ Draft mollie transaction of `order` (sale order or invoice) """
+    acquirer = env.ref('payment_mollie_official.payment_acquirer_mollie')
+    partner = order.partner_id
+    return env['payment.transaction'].create({
+        'acquirer_id': acquirer.id,
+        'reference': 'BENCH-%s' % uuid.uuid4().hex[:12],
+        'amount': order.amount_total,
+        'currency_id': order.currency_id.id,
+        'partner_id': partner.id,
+        'partner_country_id': partner.country_id.id or env.company.country_id.id,
+        'mollie_payment_method': method,
+        'sale_order_ids' if order._name == 'sale.order' else 'invoice_ids': [(6, 0, order.ids)],
+    })
+
+
+def bench_order_lines(env, order, iterations=100):
+    """ Order lines payload of `_mollie_create_order` for `order` with cold cache,
+        latencies are also reported per line.
+    """
+    acquirer = env.ref('payment_mollie_official.payment_acquirer_mollie')
+    transaction = bench_transaction(env, order)
+    lines_count = len(acquirer._mollie_get_order_lines(order, transaction))
+
+    result = run_benchmark(lambda: acquirer._mollie_get_order_lines(order, transaction), iterations=iterations, cr=env.cr, setup=env.invalidate_all)
+    result['lines'] = lines_count
+    for key in ['p50', 'p95', 'p99']:
+        result['%s_per_line' % key] = result[key] / (lines_count or 1)
+    return result
+
+
+def bench_active_methods(env, order=None, iterations=100, latency=0.0):
+    """ `mollie_get_active_methods` on checkout. `cold` fetches the methods from
+        mollie on each call, `warm` uses the methods cache.
+    """
+    acquirer = env.ref('payment_mollie_official.payment_acquirer_mollie')
+    with mollie_stand_in(env, {('GET', '/v2/methods'): fixture('methods.json')}, latency=latency) as server:
+        cold = run_benchmark(lambda: acquirer.mollie_get_active_methods(order), iterations=iterations, cr=env.cr, server=server,
+                             setup=acquirer._mollie_invalidate_methods_cache)
+        acquirer._mollie_invalidate_methods_cache()
+        warm = run_benchmark(lambda: acquirer.mollie_get_active_methods(order), iterations=iterations, cr=env.cr, server=server)
+    return {'cold': cold, 'warm': warm}
+
+
+def bench_form_generate_values(env, order, method='ideal', iterations=20, latency=0.0):
+    """ `mollie_form_generate_values` of a new transaction of `order`, it creates
+        the mollie order (or payment for the methods without orders API).
+    """
+    acquirer = env.ref('payment_mollie_official.payment_acquirer_mollie')
+    transactions = []
+    with mollie_stand_in(env, MollieOrdersStandIn().responses(), latency=latency) as server:
+        return run_benchmark(lambda: acquirer.mollie_form_generate_values({'reference': transactions[-1].reference}),
+                             iterations=iterations, cr=env.cr, server=server,
+                             setup=lambda: transactions.append(bench_transaction(env, order, method)))
+
+
+def bench_webhook(env, order, status='paid', iterations=50, latency=0.0):
+    """ Notifications of new transactions of `order` posted to `/payment/mollie/notify`
+        (`notify`, HTTP request handled by the controller with the cursor of `env`)
+        then processed by the webhook queue cron (`process`, one call for all of
+        them), mollie order has `status`. The cron processes all the pending
+        notifications of the database.
+    """
+    stand_in = MollieOrdersStandIn(status=status)
+    transactions = []
+
+    def new_transaction():
+        transaction = bench_transaction(env, order)
+        transaction.acquirer_reference = _new_id('ord')
+        stand_in.add(transaction.acquirer_reference, transaction.amount + transaction.fees, transaction.currency_id.name)
+        transactions.append(transaction)
+        env['base'].flush()
+
+    with mollie_stand_in(env, stand_in.responses(), latency=latency) as server, \
+            system_params(env, {'payment_mollie_official.webhook_coalesce_window': 0}), \
+            http_client(env) as client, no_commit(env.cr):
+
+        def notify():
+            transaction = transactions[-1]
+            response = client.post('%s?tx=%s' % (MollieController._notify_url, transaction.id), data={'id': transaction.acquirer_reference})
+            if response.status_code != 200:
+                raise ValueError('Notification of %s not accepted: %s' % (transaction.reference, response.status))
+
+        notify_result = run_benchmark(notify, iterations=iterations, cr=env.cr, server=server, setup=new_transaction)
+        env.invalidate_all()
+        process_result = run_benchmark(env['mollie.webhook.queue'].sudo()._cron_process_webhook_queue, iterations=1, cr=env.cr, server=server)
+    process_result['notifications'] = iterations
+    return {'notify': notify_result, 'process': process_result}
+
+
+def _settlement_payment(index, path):
+    settlement_id = _path_id(path)
+    return fixture('payment.json', id='tr_%s%s' % (settlement_id[4:], index), settlementId=settlement_id, description='Payment %s' % index)
+
+
+def _settlement_refund(index, path):
+    settlement_id = _path_id(path)
+    payment = _settlement_payment(index * REFUND_RATIO, path)
+    return fixture('refund.json', id='re_%s%s' % (settlement_id[4:], index), paymentId=payment['id'], settlementId=settlement_id,
+                   _embedded={'payment': payment})
+
+
+def bench_settlements(env, journal, sizes=SETTLEMENT_SIZES, latency=0.0):
+    """ `_process_settlements` of `journal` importing one settlement per size
+        (number of payments, with a refund every `REFUND_RATIO` payments).
+        Each call creates a bank statement so there is one iteration per size.
+    """
+    if not journal.mollie_api_key:
+        journal.mollie_api_key = 'test_bench'
+    payments_count = {}
+    responses = {}
+    results = {}
+    with mollie_stand_in(env, responses, latency=latency) as server:
+        responses.update({
+            ('GET', '/v2/settlements/:id/payments'): paginated(server.url, 'payments', lambda path: payments_count[_path_id(path)], _settlement_payment),
+            ('GET', '/v2/settlements/:id/refunds'): paginated(server.url, 'refunds', lambda path: payments_count[_path_id(path)] // REFUND_RATIO, _settlement_refund),
+            ('GET', '/v2/settlements/:id/captures'): paginated(server.url, 'captures', 0, None),
+            ('GET', '/v2/settlements/:id/chargebacks'): paginated(server.url, 'chargebacks', 0, None),
+        })
+
+        def import_settlement(size):
+            settlement = fixture('settlement.json', id=_new_id('stl'), reference='BENCH %s' % size)
+            payments_count[settlement['id']] = size
+            journal._process_settlements({'count': 1, '_embedded': {'settlements': [settlement]}})
+
+        for size in sizes:
+            results[size] = run_benchmark(lambda: import_settlement(size), iterations=1, cr=env.cr, server=server)
+    return results
+
+
+def _terminal(index, path):
+    return fixture('terminal.json', id='term_bench%s' % index, serialNumber='BENCH%08d' % index, description='Terminal #%s' % index)
+
+
+def bench_sync_terminals(env, count=1000, iterations=10, latency=0.0):
+    """ `_sync_mollie_terminals` of current company with `count` terminals,
+        first call creates the terminals and next ones only check for changes.
+    """
+    if not env.company.mollie_terminal_api_key:
+        env.company.mollie_terminal_api_key = 'test_bench'
+    responses = {}
+    with mollie_stand_in(env, responses, latency=latency) as server:
+        responses[('GET', '/v2/terminals')] = paginated(server.url, 'terminals', count, _terminal)
+        return run_benchmark(env['mollie.pos.terminal']._sync_mollie_terminals, iterations=iterations, cr=env.cr, server=server)
+
+
+def _shipment_stand_in(env, orders):
+    """ Mollie orders of paid transactions of `orders`, their lines are delivered in odoo """
+    stand_in = MollieOrdersStandIn(status='paid')
+    for order in orders:
+        transaction = bench_transaction(env, order)
+        transaction.write({'state': 'done', 'acquirer_reference': _new_id('ord')})
+        order_lines = order.order_line.filtered(lambda line: not line.display_type)
+        stand_in.add(transaction.acquirer_reference, transaction.amount, transaction.currency_id.name, [
+            fixture('order_line.json', id='odl_%s' % line.id, orderId=transaction.acquirer_reference, metadata={'line_id': line.id},
+                    quantity=int(line.product_uom_qty), shippableQuantity=int(line.product_uom_qty))
+            for line in order_lines
+        ])
+        for line in order_lines:
+            line.qty_delivered = line.product_uom_qty
+    return stand_in
+
+
+def bench_shipment_sync(env, orders, iterations=10, latency=0.0):
+    """ `_mollie_sync_shipment_batch` (one batch of the shipment cron) of the
+        sale `orders`, all their lines are delivered and shipped on each call.
+    """
+    stand_in = _shipment_stand_in(env, orders)
+
+    def reset_shipped():
+        orders.mapped('order_line').write({'mollie_qty_shipped': 0})
+
+    with mollie_stand_in(env, stand_in.responses(), latency=latency) as server:
+        return run_benchmark(orders._mollie_sync_shipment_batch, iterations=iterations, cr=env.cr, server=server, setup=reset_shipped)
+
+
+def bench_shipment_cron(env, orders, iterations=5, latency=0.0):
+    """ `_cron_mollie_sync_shipment` with the sale `orders` flagged on each call
+        (all their lines delivered and not shipped). Auto sync is enabled without
+        "Sync Shipment on Delivery" for the run, all the flagged orders of the
+        database are synced by the cron.
+    """
+    acquirer = env.ref('payment_mollie_official.payment_acquirer_mollie')
+    stand_in = _shipment_stand_in(env, orders)
+    previous = {'mollie_auto_sync_shipment': acquirer.mollie_auto_sync_shipment,
+                'mollie_sync_shipment_on_delivery': acquirer.mollie_sync_shipment_on_delivery}
+    acquirer.write({'mollie_auto_sync_shipment': True, 'mollie_sync_shipment_on_delivery': False})
+
+    def reset_shipped():
+        orders.mapped('order_line').write({'mollie_qty_shipped': 0})
+
+    try:
+        with mollie_stand_in(env, stand_in.responses(), latency=latency) as server, no_commit(env.cr):
+            return run_benchmark(env['sale.order']._cron_mollie_sync_shipment, iterations=iterations, cr=env.cr, server=server, setup=reset_shipped)
+    finally:
+        acquirer.write(previous)
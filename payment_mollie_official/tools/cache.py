@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """ Small thread safe in-memory cache with time based expiry and LRU eviction.
+
+        Instances are meant to live at module level so they are shared by all the
+        threads of one worker. Nothing is shared between workers so values must be
+        safe to serve stale until `ttl` seconds are elapsed.
+    """
+
+    def __init__(self, maxsize=256, ttl=300, on_evict=None):
+        """ `on_evict(key, value)` is called for values dropped from the cache (expired,
+            evicted, replaced or invalidated), e.g. to release their resources.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        evicted = []
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                    evicted.append((key, entry[1]))
+                self.misses += 1
+                value = default
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+        self._evicted(evicted)
+        return value
+
+    def set(self, key, value, ttl=None):
+        expire_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        evicted = []
+        with self._lock:
+            previous = self._data.get(key)
+            if previous is not None and previous[1] is not value:
+                evicted.append((key, previous[1]))
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            if self.on_evict:
+                # expired values not requested anymore (e.g. old API key) are released too
+                now = time.monotonic()
+                for old_key in [k for k, entry in self._data.items() if entry[0] < now]:
+                    evicted.append((old_key, self._data.pop(old_key)[1]))
+            while len(self._data) > self.maxsize:
+                old_key, (_expire_at, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+        self._evicted(evicted)
+
+    def get_or_set(self, key, compute):
+        """ Return cached value for `key` or store the result of `compute()`.
+            `compute` is called outside of the lock so slow API calls do not block other threads.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, predicate=None):
+        """ Drop all the keys or only the ones for which `predicate(key)` is true """
+        with self._lock:
+            keys = [k for k in self._data if predicate is None or predicate(k)]
+            evicted = [(key, self._data.pop(key)[1]) for key in keys]
+        self._evicted(evicted)
+
+    def _evicted(self, evicted):
+        """ Callback is called outside of the lock, it may be slow (e.g. closing connections) """
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+import sys
+import threading
+from urllib.parse import urlsplit
+
+_logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)     # upper bounds in ms, last bucket is +inf
+
+# Wrappers shared by many callers, the caller reported is the first frame outside of them
+GENERIC_FRAMES = {'_mollie_api_call', '_mollie_http_get', '_mollie_iter_items', '_mollie_stream_items', '_mollie_api_iter'}
+
+_id_segment = re.compile(r'^([a-z]{2,6}_[A-Za-z0-9]+|\d+)$')
+
+
+def normalize_endpoint(url):
+    """ `https://api.mollie.com/v2/payments/tr_WDqYK6vllg?embed=x` => `/v2/payments/:id` """
+    path = urlsplit(url).path
+    return '/'.join(':id' if _id_segment.match(segment) else segment for segment in path.split('/'))
+
+
+def get_caller(depth=2):
+    """ Odoo method at the origin of the API call, e.g. `payment_acquirer._api_mollie_get_payment` """
+    frame = sys._getframe(depth)
+    fallback = None
+    while frame:
+        module = frame.f_globals.get('__name__', '')
+        # frames of the addons `tools` (executor, client, metrics) are never the caller
+        if module.startswith('odoo.addons.') and '.tools.' not in module:
+            name = '%s.%s' % (module.rsplit('.', 1)[-1], frame.f_code.co_name)
+            if frame.f_code.co_name not in GENERIC_FRAMES:
+                return name
+            fallback = fallback or name
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+class ApiMetrics(object):
+    """ Registry of the outbound calls made to mollie API.
+
+        Calls are aggregated in memory per `(service, method, endpoint, caller)`
+        with a latency histogram, status codes, retries and bytes transferred.
+        Registry lives in the worker process, exporters registered with
+        `register_exporter` receive every call and can forward them to an
+        external metrics system to aggregate all the workers.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._exporters = []
+        self._lock = threading.Lock()
+
+    def register_exporter(self, exporter):
+        """ `exporter` is called with the dict of each recorded call, it must be fast and thread safe """
+        if exporter not in self._exporters:
+            self._exporters.append(exporter)
+
+    def unregister_exporter(self, exporter):
+        if exporter in self._exporters:
+            self._exporters.remove(exporter)
+
+    def record(self, service, method, url, status, duration, bytes_sent=0, bytes_received=0, retries=0, caller=None):
+        """ Record one API call. `status` is 0 when no response was received, `duration` is in ms """
+        sample = {
+            'service': service,
+            'method': method,
+            'endpoint': normalize_endpoint(url),
+            'caller': caller or get_caller(),
+            'status': status,
+            'duration': duration,
+            'bytes_sent': bytes_sent,
+            'bytes_received': bytes_received,
+            'retries': retries,
+        }
+        key = (service, method, sample['endpoint'], sample['caller'])
+        bucket = next((index for index, bound in enumerate(LATENCY_BUCKETS) if duration <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'retries': 0, 'bytes_sent': 0, 'bytes_received': 0,
+                    'histogram': [0] * (len(LATENCY_BUCKETS) + 1), 'status': {},
+                }
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+            stats['retries'] += retries
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+            stats['histogram'][bucket] += 1
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+        for exporter in self._exporters:
+            try:
+                exporter(sample)
+            except Exception:
+                _logger.exception('Mollie API metrics exporter %s failed', exporter)
+
+    def record_response(self, service, response, duration=None, retries=0, caller=None):
+        """ Record call from `requests` response, `duration` (ms) defaults to the response time """
+        request = response.request
+        body = request.body or b''
+        self.record(
+            service, request.method, request.url, response.status_code,
+            response.elapsed.total_seconds() * 1000 if duration is None else duration,
+            bytes_sent=len(body),
+            bytes_received=int(response.headers.get('Content-Length') or len(response.content)),
+            retries=retries, caller=caller or get_caller(),
+        )
+
+    def snapshot(self):
+        """ List of aggregated stats with percentiles estimated from the histogram """
+        with self._lock:
+            items = [(key, dict(stats, histogram=list(stats['histogram']), status=dict(stats['status']))) for key, stats in self._stats.items()]
+        result = []
+        for (service, method, endpoint, caller), stats in items:
+            result.append(dict(
+                stats,
+                service=service, method=method, endpoint=endpoint, caller=caller,
+                avg=stats['total'] / stats['count'],
+                p50=self._percentile(stats, 50),
+                p95=self._percentile(stats, 95),
+                p99=self._percentile(stats, 99),
+                errors=sum(count for status, count in stats['status'].items() if not status or status >= 400),
+            ))
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _percentile(self, stats, pct):
+        """ Upper bound of the bucket containing percentile, capped to the max seen """
+        threshold = stats['count'] * pct / 100.0
+        cumulated = 0
+        for index, count in enumerate(stats['histogram']):
+            cumulated += count
+            if cumulated >= threshold:
+                return min(LATENCY_BUCKETS[index], stats['max']) if index < len(LATENCY_BUCKETS) else stats['max']
+        return stats['max']
+
+
+api_metrics = ApiMetrics()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'DELETE'}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """ Raised without calling the API while the circuit breaker is open """
+
+
+class TokenBucket(object):
+    """ Thread safe token bucket, `rate` tokens per second with bursts up to `capacity` """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Take one token, sleep until it is available """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CircuitBreaker(object):
+    """ Stop calling the API after `failure_threshold` consecutive failures.
+
+        After `reset_timeout` seconds one trial call is let through (half open),
+        the circuit is closed again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class RequestExecutor(object):
+    """ Execute HTTP requests on mollie API for one API key.
+
+        - calls are spaced with token bucket to stay under the rate limit
+        - 429, 5xx, connection errors and timeouts are retried with jittered
+          exponential backoff, `Retry-After` header is used when present
+        - non idempotent requests are only retried on 429 (request not processed)
+        - circuit breaker fails fast while mollie is unavailable
+        - with `metrics` (`api_metrics` of payment module) each request is recorded
+          once for `service` with its number of retries
+
+        Executor is thread safe and meant to be shared by all the calls made with the same key.
+    """
+
+    def __init__(self, rate=10, max_retries=4, backoff=0.5, max_backoff=30, failure_threshold=5, reset_timeout=30, metrics=None, service=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = metrics
+        self.service = service
+
+    def request(self, method, url, **kwargs):
+        """ Same as `requests.request` but raises `HTTPError` for error status """
+        method = method.upper()
+        if not self.breaker.allow():
+            raise CircuitOpenError('Mollie API circuit is open, call to %s skipped' % url)
+        start = time.monotonic()
+        try:
+            response, attempt = self._request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self._record(method, url, getattr(e, 'response', None), start, getattr(e, 'attempt', 0))
+            raise
+        self._record(method, url, response, start, attempt)
+        return response
+
+    def _request(self, method, url, **kwargs):
+        """ Returns the response and the number of retries done, errors get the number of retries in `attempt` """
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            retry_after = None
+            try:
+                response = requests.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                retryable = method in IDEMPOTENT_METHODS
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    try:
+                        response.raise_for_status()
+                    except requests.exceptions.HTTPError as e:
+                        e.attempt = attempt
+                        raise
+                    return response, attempt
+                error = requests.exceptions.HTTPError('%s Error for url: %s' % (response.status_code, url), response=response)
+                retryable = method in IDEMPOTENT_METHODS or response.status_code == 429
+                retry_after = self._parse_retry_after(response)
+            if not retryable or attempt == self.max_retries:
+                break
+            time.sleep(self._get_delay(attempt, retry_after))
+
+        if getattr(error, 'response', None) is not None and error.response.status_code == 429:
+            self.breaker.record_success()   # API is up, we are just too fast
+        else:
+            self.breaker.record_failure()
+        error.attempt = attempt
+        raise error
+
+    def _record(self, method, url, response, start, retries):
+        """ Record the request in `metrics`, duration includes the retries """
+        if not self.metrics:
+            return
+        duration = (time.monotonic() - start) * 1000
+        if response is None:
+            self.metrics.record(self.service, method, url, 0, duration, retries=retries)
+        else:
+            self.metrics.record_response(self.service, response, duration=duration, retries=retries)
+
+    def _get_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        # "full jitter" so that parallel workers do not retry at the same time
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _parse_retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None